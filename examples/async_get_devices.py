@@ -0,0 +1,19 @@
+import asyncio
+import wso
+
+SERIALS = ["17149522502619", "17149522502620"]
+
+
+async def main():
+    # Requires aiohttp, pip install wso[async]
+    async with wso.AsyncWSO(debug=False) as uem:
+        # All lookups share one connection pool and run concurrently
+        devices = await asyncio.gather(
+            *[uem.get_device(serial_number=serial) for serial in SERIALS])
+
+    for serial, device in zip(SERIALS, devices):
+        if device:
+            print("%s,%s" % (serial, device["DeviceFriendlyName"]))
+
+
+asyncio.get_event_loop().run_until_complete(main())
@@ -8,11 +8,10 @@ UEM = wso.WSO(debug=False)
 # for OG in OGS["OrganizationGroups"]:
 #     print(OG)
 
-devices = UEM.get_all_devices(pagesize=9999999)["Devices"]
+# Devices are streamed a page at a time straight into the file so memory
+# stays bounded, use .jsonl, .parquet or .arrow for other formats
+COUNT = UEM.export_devices(
+    "devices.csv",
+    fields=["LocationGroupId.Name", "SerialNumber", "ModelId.Name", "LastSeen"])
 
-print("OG,SerialNumber,ModelId,LastSeen")
-
-for device in devices:
-    print("%s,%s,%s,%s" %
-          (device["LocationGroupId"]["Name"], device["SerialNumber"],
-           device["ModelId"]["Name"], device["LastSeen"]))
+print("Exported %s devices" % COUNT)
@@ -19,5 +19,9 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=['reqrest', 'basic_auth'],
+    extras_require={
+        'async': ['aiohttp'],
+        'export': ['pyarrow']
+    },
     include_package_data=True
 )
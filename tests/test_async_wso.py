@@ -0,0 +1,78 @@
+"""Automated testing for AsyncWSO"""
+import asyncio
+import pytest
+from wso.async_wso import AsyncWSO
+
+pytest.importorskip("aiohttp")
+
+# Define CI Test items, see test_wso.py
+ROOT_OG_ID = 4800
+TEST_PRODUCT_ID = 792
+TEST_PRODUCT_NAME = "CI Test Product"
+TEST_ACTIVE_PRODUCT_ID = 888
+TEST_GROUP_ID = 8686
+TEST_GROUP_NAME = "PyTest CI Smart group"
+TEST_DEVICE_SERIAL = 17149522502619
+TEST_DEVICE_ID = 19166
+
+
+def run(coroutine):
+    """Run a coroutine to completion"""
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+async def close_after(uem, coroutine):
+    """Await a coroutine then close the session"""
+    try:
+        return await coroutine
+    finally:
+        await uem.close()
+
+
+def test_system_info():
+    """Test system_info API"""
+    uem = AsyncWSO()
+    assert isinstance(run(close_after(uem, uem.system_info())), dict)
+
+
+def test_get_device():
+    """Test getting device info"""
+    uem = AsyncWSO()
+    device = run(close_after(uem,
+                             uem.get_device(serial_number=TEST_DEVICE_SERIAL)))
+    assert device['Id']['Value'] == TEST_DEVICE_ID
+
+    assert run(close_after(uem, uem.get_device())) is False
+
+
+def test_concurrent_names():
+    """Test resolving names concurrently over one session"""
+    uem = AsyncWSO()
+    names = run(
+        close_after(
+            uem,
+            asyncio.gather(uem.get_product_name(TEST_PRODUCT_ID),
+                           uem.get_group_name(TEST_GROUP_ID),
+                           uem.get_product_name("BADPRODUCT"))))
+
+    assert names == [TEST_PRODUCT_NAME, TEST_GROUP_NAME, False]
+
+
+def test_find_og():
+    """Test finding an OG"""
+    uem = AsyncWSO()
+    org_group = run(close_after(uem, uem.find_og(pagesize=1)))
+    assert org_group["OrganizationGroups"][0]["Id"] == ROOT_OG_ID
+
+
+def test_reprocess_product():
+    """Test reprocessing a product in chunks with a report"""
+    uem = AsyncWSO()
+    report = run(
+        close_after(
+            uem,
+            uem.reprocess_product(TEST_ACTIVE_PRODUCT_ID, [TEST_DEVICE_ID],
+                                  report=True)))
+
+    assert report['Results'] == {TEST_DEVICE_ID: True}
+    assert report['FailedChunks'] == 0
@@ -0,0 +1,56 @@
+"""Automated testing for WSO caches"""
+import time
+from wso.cache import TTLCache
+
+
+def test_get_set():
+    """Test setting and getting values"""
+    cache = TTLCache()
+    cache.set(("products", "792"), "CI Test Product")
+
+    assert cache.get(("products", "792")) == "CI Test Product"
+    assert ("products", "792") in cache
+    assert cache.get(("products", "0")) is None
+    assert cache.get(("products", "0"), False) is False
+    assert len(cache) == 1
+
+
+def test_lru():
+    """Test the least recently used value is evicted"""
+    cache = TTLCache(maxsize=2)
+    cache.set(1, "one")
+    cache.set(2, "two")
+
+    # Use 1 so 2 is the oldest
+    assert cache.get(1) == "one"
+    cache.set(3, "three")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "one"
+    assert cache.get(3) == "three"
+    assert len(cache) == 2
+
+
+def test_ttl():
+    """Test values expire"""
+    cache = TTLCache(ttl=0.1)
+    cache.set(1, "one")
+    assert cache.get(1) == "one"
+
+    time.sleep(0.2)
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_invalidate():
+    """Test removing values"""
+    cache = TTLCache()
+    cache.set(1, "one")
+    cache.set(2, "two")
+
+    assert cache.invalidate(1) is True
+    assert cache.invalidate(1) is False
+    assert cache.get(1) is None
+
+    cache.clear()
+    assert len(cache) == 0
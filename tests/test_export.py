@@ -0,0 +1,134 @@
+"""Automated testing for WSO exports"""
+import os
+import csv
+import json
+import pytest
+from wso import export
+
+DEVICES = [{
+    "Id": {
+        "Value": 1
+    },
+    "SerialNumber": "ABC123",
+    "LocationGroupId": {
+        "Id": {
+            "Value": 4800
+        },
+        "Name": "pytest"
+    },
+    "Tags": [1, 2]
+}, {
+    "Id": {
+        "Value": 2
+    },
+    "SerialNumber": "DEF456",
+    "LocationGroupId": None
+}]
+
+FIELDS = ["Id.Value", "SerialNumber", "LocationGroupId.Name", "Tags"]
+
+
+def test_get_field():
+    """Test getting dotted fields"""
+    assert export.get_field(DEVICES[0], "SerialNumber") == "ABC123"
+    assert export.get_field(DEVICES[0], "LocationGroupId.Id.Value") == 4800
+    assert export.get_field(DEVICES[0], "LocationGroupId.Missing") is None
+    assert export.get_field(DEVICES[1], "LocationGroupId.Name") is None
+
+
+def test_flatten():
+    """Test flattening a record into a row"""
+    assert export.flatten(DEVICES[0], FIELDS) == [1, "ABC123", "pytest",
+                                                 "[1, 2]"]
+    assert export.flatten(DEVICES[1], FIELDS) == [2, "DEF456", None, None]
+
+
+def test_export_format():
+    """Test getting the format from the file extension"""
+    assert export.export_format("devices.csv") == "csv"
+    assert export.export_format("devices.JSON") == "jsonl"
+    assert export.export_format("devices.jsonl") == "jsonl"
+    assert export.export_format("devices.parquet") == "parquet"
+    assert export.export_format("devices.feather") == "arrow"
+    assert export.export_format("devices.xlsx") is None
+    assert export.export_format("devices") is None
+
+
+def test_write_csv(tmp_path):
+    """Test writing a CSV"""
+    path = str(tmp_path / "devices.csv")
+    assert export.write_csv(iter(DEVICES), FIELDS, path) == 2
+
+    with open(path, newline="") as infile:
+        rows = list(csv.reader(infile))
+
+    assert rows[0] == FIELDS
+    assert rows[1] == ["1", "ABC123", "pytest", "[1, 2]"]
+    assert rows[2] == ["2", "DEF456", "", ""]
+
+
+def test_write_jsonl(tmp_path):
+    """Test writing JSON Lines"""
+    path = str(tmp_path / "devices.jsonl")
+    assert export.write_jsonl(iter(DEVICES), FIELDS, path) == 2
+
+    with open(path) as infile:
+        rows = [json.loads(line) for line in infile]
+
+    assert rows[0]["LocationGroupId.Name"] == "pytest"
+    assert rows[1]["Id.Value"] == 2
+
+
+def test_write_arrow(tmp_path):
+    """Test writing Parquet and Arrow files in batches"""
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+    path = str(tmp_path / "devices.parquet")
+    assert export.write_arrow(iter(DEVICES), FIELDS, path,
+                              batch_size=1) == 2
+
+    table = pyarrow.parquet.read_table(path)
+    assert table.column_names == FIELDS
+    assert table.column("SerialNumber").to_pylist() == ["ABC123", "DEF456"]
+
+    path = str(tmp_path / "devices.arrow")
+    assert export.write_arrow(iter(DEVICES), FIELDS, path, "arrow") == 2
+
+    table = pyarrow.ipc.open_file(path).read_all()
+    assert table.column("Id.Value").to_pylist() == [1, 2]
+
+    # Empty exports still have the columns
+    path = str(tmp_path / "empty.parquet")
+    assert export.write_arrow(iter([]), FIELDS, path) == 0
+    assert pyarrow.parquet.read_table(path).column_names == FIELDS
+
+
+def test_write_arrow_types(tmp_path):
+    """Test columns that change type between batches become strings"""
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+    records = [{"A": None, "B": 1}, {"A": 5, "B": 2}, {"A": "x", "B": "y"},
+               {"A": True, "B": 3}]
+
+    for file_format in ("parquet", "arrow"):
+        path = str(tmp_path / ("types." + file_format))
+        assert export.write_arrow(iter(records), ["A", "B"], path,
+                                  file_format, batch_size=1) == 4
+
+        if file_format == "parquet":
+            table = pyarrow.parquet.read_table(path)
+        else:
+            table = pyarrow.ipc.open_file(path).read_all()
+
+        assert table.column("A").to_pylist() == [None, "5", "x", "true"]
+        assert table.column("B").to_pylist() == ["1", "2", "y", "3"]
+        assert not [name for name in os.listdir(str(tmp_path))
+                    if name.endswith(".tmp")]
+
+    # Mixed types in one batch
+    path = str(tmp_path / "mixed.parquet")
+    assert export.write_arrow(iter(records), ["A", "B"], path) == 4
+    assert pyarrow.parquet.read_table(path).column("B").to_pylist() == \
+        ["1", "2", "y", "3"]
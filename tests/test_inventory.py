@@ -0,0 +1,206 @@
+"""Automated testing for WSO inventory caches"""
+import os
+import time
+from wso.inventory import DeviceInventory, OGIndex
+
+DEVICE = {
+    "Id": {
+        "Value": 19166
+    },
+    "SerialNumber": "17149522502619",
+    "Udid": "c37f6886ab8119f1ea5160a0e900b801",
+    "MacAddress": "00:0a:95:9d:68:16",
+    "Imei": "356938035643809",
+    "DeviceFriendlyName": "DO_NOT_DELETE pytest Android_TC51_ 2619"
+}
+
+OGS = [{
+    "Id": 4800,
+    "Name": "pytest",
+    "GroupId": "pytest",
+    "Uuid": "a9b8c7d6-0000-0000-0000-000000004800"
+}, {
+    "Id": 4801,
+    "Name": "Staged",
+    "GroupId": "staged",
+    "Uuid": "a9b8c7d6-0000-0000-0000-000000004801",
+    "ParentLocationGroup": {
+        "Id": 4800
+    }
+}, {
+    "Id": 4802,
+    "Name": "Staged",
+    "GroupId": "staged2",
+    "Uuid": "a9b8c7d6-0000-0000-0000-000000004802",
+    "ParentLocationGroup": {
+        "Id": {
+            "Value": 4801
+        }
+    }
+}]
+
+
+def test_device_lookups():
+    """Test looking up a device by each identifier"""
+    inventory = DeviceInventory()
+    assert inventory.add([DEVICE]) == 1
+    assert len(inventory) == 1
+
+    assert inventory.get("DeviceId", 19166) == DEVICE
+    assert inventory.get("Serialnumber", 17149522502619) == DEVICE
+    assert inventory.get("Udid", "C37F6886AB8119F1EA5160A0E900B801") == DEVICE
+    assert inventory.get("Macaddress", "000A959D6816") == DEVICE
+    assert inventory.get("ImeiNumber", "356938035643809") == DEVICE
+
+    assert inventory.get("Serialnumber", "BAD") is None
+    assert inventory.get("EasId", "BAD") is None
+
+    assert inventory.index()["17149522502619"] == DEVICE
+
+
+def test_device_update():
+    """Test updating a device drops its old index values"""
+    inventory = DeviceInventory()
+    inventory.add([DEVICE])
+
+    updated = dict(DEVICE)
+    updated["SerialNumber"] = "NEWSERIAL"
+    inventory.add([updated])
+
+    assert len(inventory) == 1
+    assert inventory.get("Serialnumber", "17149522502619") is None
+    assert inventory.get("Serialnumber", "NEWSERIAL") == updated
+
+    inventory.remove(19166)
+    assert inventory.get("DeviceId", 19166) is None
+    assert len(inventory) == 0
+
+
+def test_device_add_unlocked():
+    """Test the inventory isn't locked while waiting for the next device"""
+    inventory = DeviceInventory()
+
+    def devices():
+        for device_id in (1, 2):
+            assert inventory.lock.acquire(blocking=False)
+            inventory.lock.release()
+            yield {"Id": {"Value": device_id}}
+
+    assert inventory.add(devices()) == 2
+
+
+def test_device_ttl():
+    """Test entries and refreshes expire"""
+    inventory = DeviceInventory(ttl=60)
+    assert inventory.expired() is True
+
+    inventory.add([DEVICE], time.time() - 120)
+    assert inventory.index() == {}
+    assert inventory.get("DeviceId", 19166) is None
+    assert len(inventory) == 0
+
+    inventory.last_refresh = time.time()
+    assert inventory.expired() is False
+
+
+def test_device_refresh():
+    """Test incremental refreshes keep devices and full refreshes
+       drop the devices they didn't return"""
+    inventory = DeviceInventory(ttl=60, full_ttl=600)
+    assert inventory.full_due() is True
+
+    other = {"Id": {"Value": 1}, "SerialNumber": "OTHER"}
+    inventory.add([DEVICE, other], time.time() - 120)
+
+    inventory.touch(time.time())
+    assert inventory.get("DeviceId", 19166) == DEVICE
+    assert len(inventory) == 2
+
+    started = time.time()
+    inventory.add([DEVICE])
+    assert inventory.prune(started) == 1
+    assert inventory.get("DeviceId", 1) is None
+    assert inventory.get("DeviceId", 19166) == DEVICE
+
+    inventory.last_full_refresh = started
+    assert inventory.full_due() is False
+
+
+def test_device_persistence(tmpdir):
+    """Test saving and loading the inventory"""
+    path = os.path.join(str(tmpdir), "inventory.json")
+
+    inventory = DeviceInventory(path=path)
+    assert inventory.save() is True
+
+    inventory.add([DEVICE])
+    inventory.last_refresh = 1234
+    inventory.last_full_refresh = 1000
+    inventory.save()
+
+    loaded = DeviceInventory(path=path)
+    assert loaded.last_refresh == 1234
+    assert loaded.last_full_refresh == 1000
+    assert loaded.get("Serialnumber", "17149522502619") == DEVICE
+
+    assert DeviceInventory().save() is False
+
+
+def test_og_lookups():
+    """Test looking up OGs by each key and walking the tree"""
+    og_index = OGIndex()
+    assert og_index.expired() is True
+    assert og_index.load(OGS) == 3
+    assert og_index.expired() is False
+    assert len(og_index) == 3
+
+    assert og_index.get("Id", 4800) == OGS[0]
+    assert og_index.get("GroupId", "staged2") == OGS[2]
+    assert og_index.get("Uuid", OGS[1]["Uuid"]) == OGS[1]
+    assert og_index.find("Name", "Staged") == [OGS[1], OGS[2]]
+    assert og_index.get("GroupId", "missing") is None
+
+    assert og_index.get_parent(4801) == OGS[0]
+    assert og_index.get_parent(4800) is None
+    assert og_index.get_children(4800) == [OGS[1]]
+    assert og_index.get_children(4801) == [OGS[2]]
+
+    assert og_index.index("GroupId")["staged"] == OGS[1]
+
+
+def test_og_update():
+    """Test adding and removing OGs in place"""
+    og_index = OGIndex()
+    og_index.load(OGS)
+
+    new_og = {
+        "Id": 4803,
+        "Name": "New",
+        "GroupId": "new",
+        "Uuid": "a9b8c7d6-0000-0000-0000-000000004803",
+        "ParentLocationGroup": {
+            "Id": 4800
+        }
+    }
+    assert og_index.add([new_og]) == 1
+    assert og_index.get("GroupId", "new") == new_og
+    assert og_index.get_children(4800) == [OGS[1], new_og]
+
+    assert og_index.remove("Uuid", new_og["Uuid"]) == 1
+    assert og_index.get("GroupId", "new") is None
+    assert og_index.get_children(4800) == [OGS[1]]
+    assert og_index.remove("Uuid", new_og["Uuid"]) == 0
+
+    og_index.clear()
+    assert len(og_index) == 0
+    assert og_index.expired() is True
+
+
+def test_og_ttl():
+    """Test the index is due a reload after the ttl"""
+    og_index = OGIndex(ttl=0.1)
+    og_index.load(OGS)
+    assert og_index.expired() is False
+
+    time.sleep(0.2)
+    assert og_index.expired() is True
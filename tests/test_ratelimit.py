@@ -0,0 +1,61 @@
+"""Automated testing for WSO rate limiting"""
+import time
+from wso.ratelimit import RateLimiter
+
+
+def headers(remaining, limit=5000, reset=None):
+    """Generate rate limit headers"""
+    if reset is None:
+        reset = time.time() + 3600
+
+    return {
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Limit': str(limit),
+        'X-RateLimit-Reset': str(int(reset))
+    }
+
+
+def test_update():
+    """Test reading the headers"""
+    limiter = RateLimiter()
+    assert limiter.update({}) is False
+    assert limiter.update({'X-RateLimit-Remaining': 'bad'}) is False
+    assert limiter.update(headers(4000)) is True
+
+    budget = limiter.budget()
+    assert budget['Remaining'] == 4000
+    assert budget['Limit'] == 5000
+
+
+def test_no_pacing():
+    """Test requests aren't paced while the budget lasts"""
+    limiter = RateLimiter()
+
+    # No headers seen yet
+    assert limiter.acquire() == 0
+
+    limiter.update(headers(4000))
+    for _ in range(20):
+        assert limiter.acquire() == 0
+
+    budget = limiter.budget()
+    assert budget['Remaining'] == 3980
+    assert budget['Rate'] > 0
+    assert budget['Exhaustion'] > time.time()
+
+
+def test_pacing():
+    """Test requests are paced when the budget would run out"""
+    limiter = RateLimiter(burst=1, window=1)
+    limiter.update(headers(4, reset=time.time() + 1))
+
+    waited = sum(limiter.acquire() for _ in range(5))
+    assert waited > 0
+
+
+def test_exhausted():
+    """Test waiting for the reset when out of calls"""
+    limiter = RateLimiter(reserve=5)
+    limiter.update(headers(5, reset=time.time() + 1))
+
+    assert limiter.acquire() > 0
@@ -0,0 +1,67 @@
+"""Automated testing for WSO streaming JSON decoding"""
+import json
+import pytest
+from wso.stream import iter_json_array
+
+DEVICES = {
+    "Devices": [{
+        "Id": {
+            "Value": 1
+        },
+        "SerialNumber": "ABC123",
+        "DeviceFriendlyName": "Rory's é iPhone"
+    }, {
+        "Id": {
+            "Value": 2
+        },
+        "SerialNumber": "DEF456",
+        "Tags": ["[]", "{,}"]
+    }],
+    "Page": 0,
+    "PageSize": 500,
+    "Total": 2
+}
+
+
+def split(data, size):
+    """Splits bytes into chunks of size"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_iter_json_array():
+    """Test records are decoded however the bytes are chunked"""
+    data = json.dumps(DEVICES, ensure_ascii=False).encode("utf-8")
+
+    for size in (1, 2, 7, 64, len(data)):
+        meta = {}
+        devices = list(iter_json_array(split(data, size), "Devices", meta))
+
+        assert devices == DEVICES["Devices"]
+        assert meta["Total"] == 2
+        assert meta["PageSize"] == 500
+
+
+def test_iter_json_array_numbers():
+    """Test numbers split across chunks are not truncated"""
+    data = b'{"Total": 12345, "Ids": [1234, 5678, 9]}'
+    meta = {}
+
+    assert list(iter_json_array(split(data, 3), "Ids", meta)) == \
+        [1234, 5678, 9]
+    assert meta["Total"] == 12345
+
+
+def test_iter_json_array_empty():
+    """Test empty and missing arrays"""
+    assert list(iter_json_array([b'{"Devices": []}'], "Devices")) == []
+    assert list(iter_json_array([b'{}'], "Devices")) == []
+    assert list(iter_json_array([b'{"Total": 0}'], "Devices")) == []
+
+
+def test_iter_json_array_invalid():
+    """Test invalid json raises"""
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[1, 2]'], "Devices"))
+
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"Devices": [{"Id": 1}'], "Devices"))
@@ -19,3 +19,68 @@ def test_locales():
     assert UTILS.check_locale("bad") is False
     assert UTILS.check_locale(123) is False
     assert UTILS.check_locale("") is False
+
+
+def test_tables_outside_repo_root(tmpdir, monkeypatch):
+    """Tests the files are loaded from the package, not the cwd"""
+    monkeypatch.chdir(tmpdir)
+    assert Utils().check_timezone(57) is True
+
+
+def test_table_index():
+    """Tests the tables are indexed once and shared"""
+    index = UTILS.index_table("locale_code", "locales")
+    assert index["de"]["locale_code"] == "de"
+    assert Utils().index_table("locale_code", "locales") is index
+    assert UTILS.check_locale(["de"]) is False
+
+
+def test_countries():
+    """Tests verifying and looking up countries"""
+    assert UTILS.check_countries("Australia") is True
+    assert UTILS.check_countries(3) is True
+    assert UTILS.check_countries("Atlantis") is False
+    assert UTILS.lookup_country(3) == "Australia"
+    assert UTILS.get_country_id("Canada") == 2
+    assert UTILS.lookup_country(9999) is None
+
+
+def test_application_status():
+    """Tests looking up application statuses"""
+    assert UTILS.lookup_application_status(2) == "Installed"
+    assert UTILS.get_application_status_id("Removed") == 4
+    assert UTILS.lookup_application_status(99) is None
+
+
+def test_operating_systems():
+    """Tests verifying and looking up operating systems"""
+    assert UTILS.check_operating_system_id(2) is True
+    assert UTILS.check_operating_system_id(-1) is False
+    assert UTILS.lookup_operating_system(2) == "iOS 3.1"
+    assert UTILS.get_operating_system_id("iOS 3.1") == 2
+    assert UTILS.lookup_operating_system("BAD") is None
+
+
+def test_device_models():
+    """Tests verifying and looking up device models"""
+    assert UTILS.check_device_model(1) is True
+    assert UTILS.check_device_model(9999) is False
+    assert UTILS.lookup_device_model(1) == "iPhone"
+    assert UTILS.get_device_model_id("iPad") == 2
+
+
+def test_ownership():
+    """Tests verifying ownership types"""
+    assert UTILS.check_ownership_type("C") is True
+    assert UTILS.check_ownership_type("Employee Owned") is True
+    assert UTILS.check_ownership_type("X") is False
+    assert UTILS.lookup_ownership_type("S") == "Corporate Shared"
+
+
+def test_platforms():
+    """Tests verifying and looking up platforms"""
+    assert UTILS.check_platform_id(5) is True
+    assert UTILS.check_platform_id(0) is False
+    assert UTILS.lookup_platform_id(5) == "Android"
+    assert UTILS.get_platform_id("Apple") == 2
+    assert UTILS.get_platform_id("BAD") is None
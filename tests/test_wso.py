@@ -1,4 +1,5 @@
 """Automated testing for WSO"""
+import os
 import re
 import json
 import argparse
@@ -342,6 +343,25 @@ def test_get_group_name():
     assert UEM.get_group_name("BADGROUP") is False
 
 
+def test_name_cache():
+    """Tests names are cached and can be invalidated"""
+    uem = WSO()
+    assert uem.get_product_name(TEST_PRODUCT_ID) == TEST_PRODUCT_NAME
+    assert uem.name_cache.get(("products", str(TEST_PRODUCT_ID))) == \
+        TEST_PRODUCT_NAME
+
+    # Cached names are returned without calling the API
+    uem.invalidate_name("products", TEST_PRODUCT_ID, "Renamed")
+    assert uem.get_product_name(TEST_PRODUCT_ID) == "Renamed"
+
+    uem.invalidate_name("products", TEST_PRODUCT_ID)
+    assert uem.get_product_name(TEST_PRODUCT_ID) == TEST_PRODUCT_NAME
+
+    # Failures aren't cached
+    assert uem.get_group_name("BADGROUP") is False
+    assert len(uem.name_cache) == 1
+
+
 def test_filter_locals():
     """Test filtering self out of local vars"""
 
@@ -366,6 +386,28 @@ def test_remaining_api_calls():
     assert isinstance(UEM.remaining_api_calls(), int) is True
 
 
+def test_api_budget():
+    """Checks the budget is read from every response"""
+    remaining = UEM.remaining_api_calls()
+    budget = UEM.api_budget()
+
+    assert isinstance(budget['Remaining'], int) is True
+    assert budget['Remaining'] <= remaining
+    assert budget['Rate'] > 0
+
+
+def test_shared_session():
+    """Checks all API versions share one session"""
+    assert UEM.rest_v1.sessions.session is UEM.session
+    assert UEM.rest_v2.sessions.session is UEM.session
+    assert UEM.rest_v3.sessions.session is UEM.session
+
+    assert UEM.rest_v1.sessions.headers['Accept'] == \
+        "application/json;version=1"
+    assert UEM.rest_v3.sessions.headers['Accept'] == \
+        "application/json;version=3"
+
+
 def test_find_og():
     """Test finding an OG"""
 
@@ -399,6 +441,27 @@ def test_get_all_ogs():
     assert ogs["OrganizationGroups"][1]["Id"] == 4801
 
 
+def test_iter_all_ogs():
+    """Test paging through all OGs concurrently"""
+    ogs = list(UEM.iter_all_ogs(pagesize=1))
+
+    assert len(ogs) == 2
+    assert ogs[0]["Id"] == ROOT_OG_ID
+    assert ogs[1]["Id"] == 4801
+
+    assert list(UEM.iter_all_ogs(pagesize=1, stream=True)) == ogs
+
+
+def test_iter_pages():
+    """Test the paging engine against list and dict responses"""
+    groups = list(UEM.iter_pages(UEM.find_group, "SmartGroups", 1,
+                                 name=TEST_GROUP_NAME))
+    assert groups[0]["SmartGroupID"] == TEST_GROUP_ID
+
+    tags = list(UEM.iter_tags(name="CI Test - %s" % SESSION_ID))
+    assert tags == []
+
+
 def test_bulk_limits():
     """Get the console bulk limits"""
 
@@ -573,6 +636,47 @@ def test_deactivate_product():
     assert UEM.deactivate_product(TEST_PRODUCT_ID) is True
 
 
+def test_product_snapshot():
+    """Tests passing one product read through product operations"""
+    product = UEM.product_snapshot(TEST_PRODUCT_ID)
+    assert product['Active'] is False
+    assert UEM.product_snapshot(TEST_PRODUCT_ID, product) is product
+
+    assert UEM.assign_group_to_product(TEST_PRODUCT_ID, TEST_GROUP_ID,
+                                       product) is True
+    assert UEM.activate_product(TEST_PRODUCT_ID, product=product) is True
+    assert product['Active'] is True
+
+    assert UEM.deactivate_product(TEST_PRODUCT_ID, product=product) is True
+    assert product['Active'] is False
+    assert UEM.product_is_active(TEST_PRODUCT_ID) is False
+
+    assert UEM.product_snapshot(0) is False
+
+
+def test_rollout_products():
+    """Tests applying group assignment changes to many products"""
+    outcomes = UEM.rollout_products([(TEST_PRODUCT_ID, [TEST_GROUP_ID]),
+                                     (0, [TEST_GROUP_ID])],
+                                    activate=False)
+    assert outcomes[TEST_PRODUCT_ID]['Success'] is True
+    assert outcomes[TEST_PRODUCT_ID]['Added'] == []
+    assert outcomes[0]['Success'] is False
+
+    # Duplicate products are refused before anything is changed
+    assert UEM.rollout_products([(TEST_PRODUCT_ID, [TEST_GROUP_ID]),
+                                 (TEST_PRODUCT_ID, [])]) is False
+
+    outcome = UEM.rollout_product(TEST_PRODUCT_ID, [], activate=False)
+    assert outcome['Removed'] == [TEST_GROUP_ID]
+    assert UEM.check_no_group_assignments(TEST_PRODUCT_ID) is True
+
+    outcome = UEM.rollout_product(TEST_PRODUCT_ID, [TEST_GROUP_ID],
+                                  activate=False)
+    assert outcome['Added'] == [TEST_GROUP_ID]
+    assert outcome['Success'] is True
+
+
 def test_remove_groups_from_products():
     """Test removing all groups from a product"""
     # Remove the groups just assigned
@@ -612,6 +716,63 @@ def test_get_all_devices():
     assert devices["Devices"][0]['Id']['Value'] == TEST_DEVICE_ID
 
 
+def test_iter_all_devices():
+    """Test iterating over all devices one page at a time"""
+    devices = list(UEM.iter_all_devices(pagesize=1))
+    assert devices[0]['Id']['Value'] == TEST_DEVICE_ID
+    assert len(devices) == UEM.get_all_devices()["Total"]
+
+    # Filters are passed through to get_all_devices
+    assert list(UEM.iter_all_devices(user=random_string())) == []
+
+
+def test_iter_all_devices_stream():
+    """Test streaming devices as they are downloaded"""
+    assert list(UEM.iter_all_devices(pagesize=1, stream=True)) == \
+        list(UEM.iter_all_devices(pagesize=1))
+
+    assert list(UEM.iter_all_devices(user=random_string(),
+                                     stream=True)) == []
+
+    meta = {}
+    devices = list(
+        UEM.stream_get('/api/mdm/devices/search', "Devices", version=1,
+                       meta=meta))
+    assert len(devices) == meta["Total"]
+
+
+def test_export_devices():
+    """Test exporting devices to a CSV"""
+    filename = "%s.csv" % SESSION_ID
+    count = UEM.export_devices(filename, fields=["Id.Value", "ModelId.Name"])
+
+    assert count == UEM.get_all_devices()["Total"]
+    with open(filename) as infile:
+        lines = infile.read().splitlines()
+    os.remove(filename)
+
+    assert lines[0] == "Id.Value,ModelId.Name"
+    assert len(lines) == count + 1
+
+    assert UEM.export_devices("%s.xlsx" % SESSION_ID) is False
+
+
+def test_inventory():
+    """Test resolving devices from the local inventory"""
+    uem = WSO()
+    inventory = uem.enable_inventory(ttl=60)
+    assert inventory.get("Serialnumber", TEST_DEVICE_SERIAL) is not None
+
+    device = uem.get_device(serial_number=TEST_DEVICE_SERIAL)
+    assert device['Id']['Value'] == TEST_DEVICE_ID
+
+    # Incremental refresh only returns recently seen devices
+    assert isinstance(uem.refresh_inventory(), int)
+    assert uem.refresh_inventory(full=True) == len(inventory)
+
+    assert WSO().refresh_inventory() is False
+
+
 def test_get_device_ip():
     """Tests getting a device IP"""
     assert UEM.get_device_ip(
@@ -687,6 +848,141 @@ def test_create_group_from_devices_bulk():
                                          []) is False
 
 
+def test_format_group_payload_devices_index():
+    """Tests building a group payload from a reusable device index"""
+    index = UEM.index_devices(UEM.iter_all_devices())
+    assert index[str(TEST_DEVICE_SERIAL)]['Id']['Value'] == TEST_DEVICE_ID
+
+    payload = UEM.format_group_payload_devices('CI Test - %s' % SESSION_ID,
+                                               [TEST_DEVICE_SERIAL, 12345],
+                                               device_index=index)
+
+    assert payload['DeviceAdditions'] == [{
+        'Id': TEST_DEVICE_ID,
+        'Name': TEST_DEVICE_FRIENDLY_NAME
+    }]
+
+
+def test_resolve_devices():
+    """Tests resolving device identifiers by lookup and by scan"""
+    uem = WSO()
+    missing = random_string()
+
+    for trigger in (50, 0):
+        uem.bulk_query_trigger = trigger
+
+        result = uem.resolve_devices(serials=[TEST_DEVICE_SERIAL, missing])
+        assert result['DeviceIds'] == {TEST_DEVICE_SERIAL: TEST_DEVICE_ID}
+        assert result['Missing'] == [missing]
+        assert result['Devices'][TEST_DEVICE_SERIAL]['Udid'] == \
+            TEST_DEVICE_UDID
+
+        udid = TEST_DEVICE_UDID.upper()
+        result = uem.resolve_devices(udids=[udid])
+        assert result['DeviceIds'] == {udid: TEST_DEVICE_ID}
+
+    assert uem.resolve_devices() is False
+
+
+def test_device_query_strategy():
+    """Tests picking between device lookups and a scan"""
+    uem = WSO(bulk_query_trigger=10)
+    assert uem.device_query_strategy(10) == "lookup"
+    assert uem.device_query_strategy(11) == "scan"
+    assert uem.device_query_strategy(11, "EasId") == "lookup"
+
+    uem = WSO(bulk_query_trigger="auto")
+    assert uem.fleet_size() == 1
+    assert uem.device_query_strategy(1) == "lookup"
+    assert uem.device_query_strategy(1000) == "scan"
+
+    assert uem.measured_latency('/api/mdm/devices') is None
+    uem.get_device(serial_number=TEST_DEVICE_SERIAL)
+    assert uem.measured_latency('/api/mdm/devices') > 0
+
+
+def test_sync_group_devices():
+    """Tests syncing group membership without recreating the group"""
+    group = UEM.create_group_from_devices('CI Test - %s - Sync' % SESSION_ID,
+                                          [TEST_DEVICE_SERIAL])
+    assert isinstance(group, int)
+
+    # Nothing to change so no update is sent
+    missing = random_string()
+    report = UEM.sync_group_devices(group, [TEST_DEVICE_SERIAL, missing])
+    assert report['Added'] == []
+    assert report['Removed'] == []
+    assert report['Missing'] == [missing]
+    assert report['Updated'] is False
+
+    # Failed lookups don't empty the group
+    assert UEM.sync_group_devices(group, [missing]) is False
+
+    # Remove then add the device back
+    report = UEM.sync_group_devices(group, [])
+    assert report['Removed'] == [TEST_DEVICE_ID]
+    assert report['Updated'] is True
+    assert not UEM.get_group(group)['DeviceAdditions']
+
+    report = UEM.sync_group_devices(group, [TEST_DEVICE_SERIAL])
+    assert report['Added'] == [TEST_DEVICE_ID]
+    assert report['Updated'] is True
+    assert [device['Id'] for device in
+            UEM.get_group(group)['DeviceAdditions']] == [TEST_DEVICE_ID]
+
+    assert UEM.delete_group(group) is True
+
+    assert UEM.sync_group_devices(0, [TEST_DEVICE_SERIAL]) is False
+
+
+def test_sync_group_devices_pages():
+    """Tests every page of group members is kept when syncing, the group
+       and update are stubbed"""
+    uem = WSO()
+
+    members = [{"Id": i, "Name": "Device %i" % i} for i in range(5)]
+
+    def get_group(group_id, pagesize=500, page=0):
+        group = {"SmartGroupID": group_id, "Name": "Paged"}
+        group["DeviceAdditions"] = members[page * pagesize:(page + 1) *
+                                           pagesize]
+        return group
+
+    sent = []
+
+    def put(path, payload, querystring=""):
+        sent.append((path, json.loads(payload)))
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    uem.get_group = get_group
+    uem.rest_v1.put = put
+    uem.resolve_devices = lambda serials: {
+        "Devices": {
+            "NEW": {
+                "Id": {
+                    "Value": 9
+                },
+                "DeviceFriendlyName": "New"
+            }
+        },
+        "DeviceIds": {
+            "NEW": 9
+        },
+        "Missing": ["GONE"]
+    }
+
+    assert len(uem.get_group_all_devices(1, pagesize=2)['DeviceAdditions']) \
+        == 5
+
+    report = uem.sync_group_devices(1, ["NEW", "GONE"], pagesize=2)
+    assert report['Added'] == [9]
+    assert report['Removed'] == []
+    assert [device['Id'] for device in sent[0][1]['DeviceAdditions']] == \
+        [0, 1, 2, 3, 4, 9]
+
+
 def test_create_delete_group_from_og():
     """Creates a group based on a list of OGs, deletes it"""
 
@@ -708,6 +1004,28 @@ def test_create_delete_group_from_og():
     assert UEM.delete_group(ASSIGNED_GROUP) is False
 
 
+def test_format_group_payload_ogs_index():
+    """Tests resolving OGs concurrently and from a reusable index"""
+    ogs = UEM.resolve_ogs([ROOT_OG, random_string()])
+    assert list(ogs) == [ROOT_OG]
+    assert ogs[ROOT_OG]['Id'] == ROOT_OG_ID
+
+    # Partial names don't match
+    assert UEM.resolve_ogs([ROOT_OG[:-1]]) == {}
+
+    index = UEM.index_ogs(UEM.iter_all_ogs())
+    assert index[ROOT_OG]['Id'] == ROOT_OG_ID
+
+    payload = UEM.format_group_payload_ogs('CI Test - %s' % SESSION_ID,
+                                           [ROOT_OG, "ABCD"],
+                                           og_index=index)
+    assert payload['OrganizationGroups'] == [{
+        'Id': ROOT_OG_ID,
+        'Name': ROOT_OG,
+        'Uuid': index[ROOT_OG]['Uuid']
+    }]
+
+
 def test_tag_full():
     """Test creating a tag, assign, unassign, and delete"""
     new_tag = UEM.create_tag('CI Test - %s' % SESSION_ID)
@@ -720,6 +1038,16 @@ def test_tag_full():
     assert UEM.add_tag(tag_id, [TEST_DEVICE_ID])
     assert UEM.get_tagged_devices(tag_id)[0]['DeviceId'] == TEST_DEVICE_ID
     assert UEM.remove_tag(tag_id, [TEST_DEVICE_ID]) is True
+
+    # Chunked with a report
+    report = UEM.add_tag(tag_id, [TEST_DEVICE_ID, 0], report=True)
+    assert report['TotalItems'] == 2
+    assert report['Results'][TEST_DEVICE_ID] is True
+    assert report['Results'][0] is False
+    assert report['FailedChunks'] == 0
+    report = UEM.remove_tag(tag_id, [TEST_DEVICE_ID], report=True)
+    assert report['AcceptedItems'] == 1
+
     assert UEM.delete_tag(tag_id) is True
 
 
@@ -823,6 +1151,12 @@ def test_create_og():
     payload['Name'] = "Unique"
     assert UEM.create_og(ROOT_OG_ID, payload) is False
 
+    # The new OG is added to the index in place
+    og_index = UEM.get_og_index()
+    assert og_index.get("Id", response['Id'])['GroupId'] == payload['GroupId']
+    assert og_index.get("Id", response['Id']) in og_index.get_children(
+        ROOT_OG_ID)
+
     # Test blank payload
     # TODO: Fix
     # assert UEM.create_og(ROOT_OG_ID, "") is False
@@ -841,10 +1175,107 @@ def test_delete_og():
     # Make sure it was deleted
     assert UEM.find_og(name="CI Test - %s" %
                        SESSION_ID)['OrganizationGroups'] == []
-
-
-# TODO add reprocess coverage
-# def reprocess_product(self, product_id, device_list, force=True):
+    assert UEM.get_og_index().get("Uuid", og_uuid) is None
+
+
+def test_provision_ogs():
+    """Test creating a tree of OGs level by level"""
+    parent = UEM.format_og_payload("CI Test - %s - Parent" % SESSION_ID,
+                                   "%s-P" % SESSION_ID,
+                                   "Container",
+                                   country="Australia",
+                                   locale="en-AU",
+                                   timezone=57)
+    child = UEM.format_og_payload("CI Test - %s - Child" % SESSION_ID,
+                                  "%s-C" % SESSION_ID,
+                                  "Container",
+                                  country="Australia",
+                                  locale="en-AU",
+                                  timezone=57)
+    assert parent and child
+    child["ParentGroupId"] = parent["GroupId"]
+
+    report = UEM.provision_ogs([child, parent], ROOT_OG_ID)
+    assert report['Created'] == [parent["GroupId"], child["GroupId"]]
+    assert report['Failed'] == []
+
+    og_index = UEM.get_og_index()
+    assert og_index.get_parent(report['Ids'][child["GroupId"]])['Id'] == \
+        report['Ids'][parent["GroupId"]]
+
+    # Existing OGs are skipped
+    report = UEM.provision_ogs([parent], ROOT_OG_ID)
+    assert report['Existing'] == [parent["GroupId"]]
+
+    # Invalid, blank and duplicate entries fail
+    blank = dict(parent, GroupId="")
+    report = UEM.provision_ogs([False, blank, parent, parent], ROOT_OG_ID)
+    assert report['Failed'] == [False, blank, parent["GroupId"],
+                                parent["GroupId"]]
+    assert report['Created'] == [] and report['Existing'] == []
+
+    for name in (child["Name"], parent["Name"]):
+        assert UEM.delete_og(
+            UEM.find_og(name=name)['OrganizationGroups'][0]['Uuid'])
+
+
+def test_bulk_command():
+    """Test sending a command to many devices"""
+    report = UEM.bulk_command('DeviceQuery', [TEST_DEVICE_ID, 0])
+
+    assert report['TotalItems'] == 2
+    assert report['Results'][TEST_DEVICE_ID] is True
+    assert report['Results'][0] is False
+
+    report = UEM.bulk_command('SyncDevice', [TEST_DEVICE_SERIAL],
+                              id_type='Serialnumber')
+    assert report['AcceptedItems'] == 1
+
+    assert UEM.bulk_command('BadCommand', [TEST_DEVICE_ID]) is False
+    assert UEM.bulk_command('SyncDevice', [TEST_DEVICE_ID], 'Bad') is False
+
+
+def test_bulk_command_wipe_limits():
+    """Test wipes are refused above the bulk limit or without one,
+       the limits are stubbed so no wipe is ever sent"""
+    uem = WSO()
+
+    sent = []
+    uem.run_bulk = lambda *args, **kwargs: sent.append(args)
+
+    uem.bulk_settings = {"EnableBulkLimits": True, "EnterpriseWipe": 10}
+    assert uem.bulk_command('EnterpriseWipe', list(range(11))) is False
+    assert uem.bulk_command('DeviceWipe', list(range(11))) is False
+    assert uem.bulk_command('EnterpriseReset', list(range(11))) is False
+
+    uem.bulk_settings = {"EnableBulkLimits": False}
+    assert uem.bulk_command('EnterpriseWipe', [0]) is False
+
+    uem.bulk_settings = {"EnableBulkLimits": True}
+    assert uem.bulk_command('DeviceWipe', [0]) is False
+
+    assert sent == []
+
+
+def test_reprocess_product():
+    """Test reprocessing products for all and listed devices"""
+    assert UEM.reprocess_product(TEST_ACTIVE_PRODUCT_ID, None) is True
+
+    report = UEM.reprocess_product(TEST_ACTIVE_PRODUCT_ID, [], report=True)
+    assert report['TotalItems'] == 0
+    assert report['FailedChunks'] == 0
+
+    report = UEM.reprocess_product(TEST_ACTIVE_PRODUCT_ID, [TEST_DEVICE_ID],
+                                   report=True)
+    assert report['Results'] == {TEST_DEVICE_ID: True}
+
+    assert UEM.reprocess_products({
+        TEST_ACTIVE_PRODUCT_ID: [TEST_DEVICE_ID],
+        TEST_ASSIGNED_PRODUCT: None
+    }) == {
+        TEST_ACTIVE_PRODUCT_ID: True,
+        TEST_ASSIGNED_PRODUCT: True
+    }
 
 
 def test_tidy_up():  # pragma: no cover
@@ -1 +1,2 @@
-from .wso import WSO
+from .wso import WSO, PagingError
+from .async_wso import AsyncWSO
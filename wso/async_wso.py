@@ -0,0 +1,593 @@
+"""Asyncio client for WSO UEM, covers a subset of the WSO facade"""
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from wso.wso import WSO, LazyArgs
+
+
+class AsyncResponse():
+    """Buffered HTTP response, has the attributes WSO uses from requests"""
+    def __init__(self, status_code, text, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+
+class AsyncWSO():
+    """Asyncio WSO API facade, all API calls are coroutines that share
+       one pooled aiohttp session. It covers the read calls, products,
+       tags and device moves and deletes, use WSO for the rest such as
+       creating groups, OGs and tags, users, admins and bulk_command().
+       Bulk calls share the chunking and reports of the WSO client"""
+    def __init__(self,
+                 config_dir="config",
+                 config_file="uem.json",
+                 debug=False,
+                 max_connections=100):
+
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncWSO requires aiohttp, install it with pip install wso[async]"
+            )
+
+        # Reuse the sync facade for config, headers and response handling
+        self.wso = WSO(config_dir=config_dir,
+                       config_file=config_file,
+                       debug=debug)
+
+        # Create logging functions
+        self.debug = self.wso.debug
+        self.info = self.wso.info
+        self.warning = self.wso.warning
+        self.error = self.wso.error
+        self.critical = self.wso.critical
+
+        self.config = self.wso.config
+        self.max_connections = max_connections
+        self.timeout = 9999
+        self.protocol = 'https'
+
+        # Retries like the sync session, see WSO.create_session(). Gateway
+        # errors are only retried for idempotent methods as a POST may
+        # have been applied. Unlike the sync session 429s are retried for
+        # every method, the request was rejected so it's safe to resend
+        self.retries = 5
+        self.backoff_factor = 1
+        self.retry_statuses = (429, 502, 503, 504)
+        self.retry_methods = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS",
+                              "TRACE")
+
+        # aiohttp wants a scheme on the proxy
+        self.proxy = self.wso.import_proxy()
+        if self.proxy is not None:
+            self.proxy = self.proxy['https']
+            if "://" not in self.proxy:
+                self.proxy = "http://%s" % self.proxy
+
+        # The session has to be created inside the running loop
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    def get_session(self):
+        """Returns the shared session, creating it on first use"""
+        if self.session is None or self.session.closed:
+            headers = self.wso.create_headers()
+            del headers['Accept']
+
+            self.session = aiohttp.ClientSession(
+                headers=headers,
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        return self.session
+
+    async def close(self):
+        """Close the shared session"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self,
+                      method,
+                      path,
+                      version=1,
+                      querystring=None,
+                      json=None):
+        """HTTP request against the UEM API, returns an AsyncResponse.
+           Requests are paced by the shared rate limiter and retried with
+           backoff on 429 and gateway errors"""
+        url = "%s://%s%s" % (self.protocol, self.config['url'], path)
+        headers = {'Accept': "application/json;version=%s" % version}
+        loop = asyncio.get_event_loop()
+
+        attempt = 0
+        while True:
+            # acquire() sleeps when pacing, keep it off the event loop
+            await loop.run_in_executor(None, self.wso.rate_limiter.acquire)
+
+            async with self.get_session().request(
+                    method,
+                    url,
+                    headers=headers,
+                    params=querystring,
+                    json=json,
+                    proxy=self.proxy) as response:
+                text = await response.text()
+                self.wso.rate_limiter.update(response.headers)
+
+                result = AsyncResponse(response.status, text,
+                                       response.headers)
+
+            if not self.retryable(method, result.status_code) or \
+                    attempt >= self.retries:
+                return result
+
+            delay = self.retry_delay(result, attempt)
+            attempt += 1
+            self.warning("%s %s returned %i, retrying in %.1fs", method, path,
+                         result.status_code, delay)
+            await asyncio.sleep(delay)
+
+    def retryable(self, method, status_code):
+        """Checks if a response status should be retried for a method"""
+        if status_code == 429:
+            return True
+
+        return status_code in self.retry_statuses and \
+            method.upper() in self.retry_methods
+
+    def retry_delay(self, response, attempt):
+        """Seconds to wait before a retry, uses Retry-After if present"""
+        try:
+            return max(float(response.headers['Retry-After']), 0)
+        except (KeyError, TypeError, ValueError):
+            return self.backoff_factor * (2**attempt)
+
+    async def simple_get(self, path, querystring=None, version=2):
+        """Simple HTTP get given a path"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        response = await self.request("GET", path, version, querystring)
+
+        # Check response and return validated data
+        check = self.wso.check_http_response(response)
+        if check and response.status_code != 204:
+            return self.wso.str_to_json(response.text)
+
+        # 204 is no content, in WSO that's
+        # usually no results found for searches
+        elif check and response.status_code == 204:
+            return None
+
+        return False
+
+    async def get_name(self, item_type, item_id):
+        """Appends item_type and item_id to base\
+           URL and returns the Name key"""
+        response = await self.simple_get('/api/mdm/%s/%s' %
+                                         (item_type, item_id),
+                                         version=1)
+
+        if response:
+            return response['Name']
+
+        self.error('Error gettting %s %s name', item_type, item_id)
+        return False
+
+    async def get_product_name(self, product_id):
+        """Resolves a product ID to name"""
+        return await self.get_name("products", product_id)
+
+    async def get_group_name(self, group_id):
+        """Resolves a smartgroup ID to a name"""
+        return await self.get_name("smartgroups", group_id)
+
+    # System calls
+
+    async def system_info(self):
+        """Returns the UEM sys info page"""
+        return await self.simple_get('/api/system/info', version=1)
+
+    async def find_og(self, name=None, pagesize=500, page=0):
+        """Find ogs based on name"""
+        querystring = self.wso.querystring(name=name,
+                                           pagesize=pagesize,
+                                           page=page)
+
+        return await self.simple_get('/api/system/groups/search',
+                                     querystring, 2)
+
+    async def get_og(self, group_id: int):
+        """Get an OG by ID"""
+        return await self.simple_get('/api/system/groups/%i' % group_id,
+                                     version=1)
+
+    async def get_all_ogs(self, pagesize=500, page=0):
+        """Abstract function of find_og()"""
+        return await self.find_og(pagesize=pagesize, page=page)
+
+    # MDM Queries
+    async def bulk_limits(self):
+        """Returns the console bulk limits"""
+        return await self.simple_get('/api/mdm/devices/bulksettings',
+                                     version=1)
+
+    async def device_counts(self, organizationgroupid=None):
+        """Returns the device counts"""
+        querystring = self.wso.querystring(
+            organizationgroupid=organizationgroupid)
+
+        return await self.simple_get('/api/mdm/devices/devicecountinfo',
+                                     querystring, 1)
+
+    async def get_group(self, group_id: int, pagesize=500, page=0):
+        """Get a group from the ID"""
+        querystring = self.wso.querystring(pagesize=pagesize, page=page)
+
+        return await self.simple_get('/api/mdm/smartgroups/%i' % group_id,
+                                     querystring, 1)
+
+    async def find_group(self, name=None, pagesize=500, page=0):
+        """Find a group by name"""
+        querystring = self.wso.querystring(name=name,
+                                           pagesize=pagesize,
+                                           page=page)
+
+        return await self.simple_get('/api/mdm/smartgroups/search',
+                                     querystring, 1)
+
+    async def find_product(self,
+                           name,
+                           smartgroupid=None,
+                           pagesize=500,
+                           page=0):
+        """Search for product by name"""
+        querystring = self.wso.querystring(name=name,
+                                           smartgroupid=smartgroupid,
+                                           pagesize=pagesize,
+                                           page=page)
+
+        return await self.simple_get('/api/mdm/products/search',
+                                     querystring, 1)
+
+    async def get_product(self, product_id: int):
+        """Get product by ID"""
+        return await self.simple_get('/api/mdm/products/%i' % product_id,
+                                     version=1)
+
+    async def get_product_device_state(self,
+                                       product_id: int,
+                                       state: str,
+                                       pagesize=500,
+                                       page=0):
+        """Get the devices of a product in a state"""
+        # Check if state is valid
+        if state not in ['compliant', 'inprogress', 'failed', 'assigned']:
+            self.error('Invalid state %s', state)
+            return None
+
+        querystring = self.wso.querystring(pagesize=pagesize, page=page)
+
+        return await self.simple_get(
+            '/api/mdm/products/%i/%s' % (product_id, state), querystring, 2)
+
+    async def get_product_assigned_groups(self, product_id: int):
+        """Gets all assigned groups for a product id"""
+        product = await self.get_product(product_id)
+
+        if product is not False:
+            return product['SmartGroups']
+        return False
+
+    async def product_is_active(self, product_id):
+        """Checks if a product is active, returns Bool"""
+        product = await self.get_product(product_id)
+
+        return product['Active']
+
+    async def xctivate_product(self, action: str, product_id: int,
+                               skip_check: bool):
+        """Activates or Deactivates a product based on ID, returns Bool"""
+        product = await self.get_product(product_id)
+
+        if not product:
+            self.error("Invalid product ID: %s", product_id)
+            return False
+
+        # Check that there is at least 1 group assigned
+        if not product['SmartGroups'] and skip_check is False \
+                and action == "activate":
+            self.error(
+                "There are no smart groups assigned to %s, unable to activate",
+                product['Name'])
+            return False
+
+        # Check if anything needs to be done
+        if (product['Active'] and action == 'activate') or (
+                not product['Active'] and action == 'deactivate'):
+            self.warning('Product %s is already in the desired state',
+                         product["Name"])
+            return True
+
+        response = await self.request(
+            "POST", '/api/mdm/products/%i/%s' % (product_id, action))
+
+        return self.wso.check_http_response(response)
+
+    async def activate_product(self, product_id, skip_check=False):
+        """Activates a product"""
+        return await self.xctivate_product('activate', product_id, skip_check)
+
+    async def deactivate_product(self, product_id, skip_check=True):
+        """Deactivates a product"""
+        return await self.xctivate_product('deactivate', product_id,
+                                           skip_check)
+
+    async def get_device(self,
+                         device_id=None,
+                         macaddress=None,
+                         udid=None,
+                         serial_number=None,
+                         imei=None,
+                         eas_id=None,
+                         pagesize=500,
+                         page=0):
+        """Get devices from AirWatch"""
+        # Map ids against the WSO format
+        ids = {}
+        ids["DeviceId"] = device_id
+        ids["Macaddress"] = macaddress
+        ids["Udid"] = udid
+        ids["Serialnumber"] = serial_number
+        ids["ImeiNumber"] = imei
+        ids["EasId"] = eas_id
+
+        _id = None
+
+        for _query in ids:
+            if ids[_query] is not None:
+                _id = _query
+                break
+
+        if _id is None:
+            self.error("No device search parameters speficied")
+            return False
+
+        querystring = self.wso.querystring(searchBy=_id,
+                                           id=ids[_id],
+                                           pagesize=pagesize,
+                                           page=page)
+
+        return await self.simple_get('/api/mdm/devices', querystring, 1)
+
+    async def get_all_devices(self, pagesize=500, page=0, **filters):
+        """Get all devices from AirWatch, accepts the
+           same filters as WSO.get_all_devices()"""
+        querystring = self.wso.querystring(pagesize=pagesize,
+                                           page=page,
+                                           **filters)
+
+        return await self.simple_get('/api/mdm/devices/search', querystring,
+                                     1)
+
+    async def assign_group_to_product(self, product_id: int, group_id: int):
+        """Assigns a group to a product"""
+        group_name, product = await asyncio.gather(
+            self.get_group_name(group_id), self.get_product(product_id))
+
+        if not group_name:
+            self.error('Invalid group ID: %i', group_id)
+            return False
+
+        if not product:
+            self.error('Invalid product ID: %i', product_id)
+            return False
+
+        # Check if group is already assigned
+        for group in product['SmartGroups']:
+            if group['SmartGroupId'] == group_id:
+                self.warning('Smart group %s already assigned to %s',
+                             product_id, group_id)
+                return True
+
+        response = await self.request(
+            "POST", '/api/mdm/products/%s/addsmartgroup/%s' %
+            (product_id, group_id))
+
+        # New assignments on active products need a reprocess
+        # see WSO.assign_group_to_product()
+        if self.wso.check_http_response(response) and product['Active']:
+            return await self.reprocess_product(product_id=product_id,
+                                                device_list=None,
+                                                force=False)
+
+        return self.wso.check_http_response(response)
+
+    async def remove_group_from_product(self, product_id, group_id):
+        """Removes the specified group from a product"""
+        response = await self.request(
+            "POST", '/api/mdm/products/%s/removesmartgroup/%s' %
+            (product_id, group_id))
+
+        return self.wso.check_http_response(response)
+
+    async def run_bulk(self,
+                       path,
+                       values,
+                       chunk_size,
+                       querystring=None,
+                       retries=2,
+                       post=None):
+        """Sends values to a bulk endpoint in concurrent chunks, see
+           WSO.run_bulk(). Returns the same per value report"""
+        if post is None:
+            post = self.post_bulk
+
+        chunks = self.wso.bulk_chunks(path, values, chunk_size)
+
+        async def send(chunk):
+            faults = await post(path, chunk, querystring)
+
+            for attempt in range(retries):
+                if faults is not None:
+                    break
+                self.warning("Retrying chunk of %i, attempt %i", len(chunk),
+                             attempt + 1)
+                await asyncio.sleep(2**attempt)
+                faults = await post(path, chunk, querystring)
+
+            return faults
+
+        results = await asyncio.gather(*[send(chunk) for chunk in chunks])
+
+        return self.wso.bulk_report(chunks, results)
+
+    async def post_bulk(self, path, values, querystring=None):
+        """POSTs a BulkValues payload, see WSO.post_bulk()"""
+        response = await self.request("POST",
+                                      path,
+                                      querystring=querystring,
+                                      json=self.wso.bulk_payload(values))
+
+        return self.wso.bulk_faults(path, response)
+
+    async def reprocess_product(self,
+                                product_id,
+                                device_list,
+                                force=True,
+                                report=False):
+        """Reprocess a product, all devices if device_list is empty.
+           Device lists are sent in concurrent chunks, see
+           WSO.reprocess_product()"""
+        async def post(path, chunk, querystring=None):
+            response = await self.request(
+                "POST",
+                path,
+                querystring=querystring,
+                json=self.wso.reprocess_payload(product_id, chunk, force))
+
+            # The API doesn't report faults per device
+            if self.wso.check_http_response(response):
+                return {}
+
+            return None
+
+        path = '/api/mdm/products/reprocessProduct'
+
+        reprocess_report = await self.run_bulk(path,
+                                               device_list or [],
+                                               self.wso.bulk_chunk_size,
+                                               post=post)
+
+        # All devices is one request with no device IDs
+        if not device_list and await post(path, []) is None:
+            reprocess_report['FailedChunks'] += 1
+
+        if report:
+            return reprocess_report
+
+        return reprocess_report['FailedChunks'] == 0
+
+    async def find_tag(self, name=None, org_group=None, pagesize=500, page=0):
+        """Gets tags, supports all or searching, returns json"""
+        if org_group is None:
+            # Set the product to be at the highest OG
+            org_group = (
+                await self.find_og(pagesize=1))['OrganizationGroups'][0]['Id']
+
+        querystring = self.wso.querystring(name=name,
+                                           OrganizationGroupId=org_group,
+                                           pagesize=pagesize,
+                                           page=page)
+
+        response = await self.simple_get("/api/mdm/tags/search", querystring,
+                                         1)
+
+        if response:
+            return response['Tags']
+        return response
+
+    async def add_tag(self, tag_id: int, devices: list, report=False):
+        """Adds tags to device list, returns bool or the report"""
+        return await self.x_tag('add', tag_id, devices, report)
+
+    async def remove_tag(self, tag_id: int, devices: list, report=False):
+        """Removes tags from device list, returns bool or the report"""
+        return await self.x_tag('remove', tag_id, devices, report)
+
+    async def x_tag(self, action, tag_id: int, devices: list, report=False):
+        """Performs an action on device tags in concurrent chunks, see
+           WSO.x_tag()"""
+        if action not in ['add', 'remove']:
+            self.error('%s invalid action', action)
+            return False
+
+        tag_report = await self.run_bulk(
+            '/api/mdm/tags/%i/%sdevices' % (tag_id, action), devices,
+            self.wso.bulk_chunk_size)
+
+        if report:
+            return tag_report
+
+        return tag_report['FailedChunks'] == 0
+
+    async def get_tagged_devices(self, tag_id: int):
+        """Get all devices tagged with tag provided"""
+        response = await self.simple_get('/api/mdm/tags/%i/devices' % tag_id)
+
+        if response:
+            return response['Device']
+        return False
+
+    async def move_og(self,
+                      og_id: int,
+                      macaddress=None,
+                      udid=None,
+                      serial_number=None,
+                      imei=None):
+        """Move device in another OG"""
+        # Map ids against the WSO format
+        ids = {}
+        ids["Macaddress"] = macaddress
+        ids["Udid"] = udid
+        ids["Serialnumber"] = serial_number
+        ids["ImeiNumber"] = imei
+
+        _id = None
+
+        for _query in ids:
+            if ids[_query] is not None:
+                _id = _query
+                break
+
+        if _id is None:
+            self.error("No device search parameters speficied")
+            return False
+
+        querystring = self.wso.querystring(searchBy=_id,
+                                           id=ids[_id],
+                                           ogid=og_id)
+
+        response = await self.request(
+            "POST",
+            '/api/mdm/devices/commands/changeorganizationgroup',
+            querystring=querystring)
+
+        return self.wso.check_http_response(response, 202)
+
+    async def delete_device(self, device_id):
+        """Delete a device using the device ID"""
+        response = await self.request("DELETE",
+                                      '/api/mdm/devices/%s' % device_id)
+        self.warning("%s has been deleted", device_id)
+
+        return self.wso.check_http_response(response, 200)
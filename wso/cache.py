@@ -0,0 +1,57 @@
+"""Caches used by WSO"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache():
+    """Thread safe LRU cache, entries also expire ttl seconds after
+       they are set"""
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        # key => (expiry time, value), oldest used first
+        self.entries = OrderedDict()
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        """Get a value, returns default if missing or expired"""
+        with self.lock:
+            try:
+                expires, value = self.entries[key]
+            except KeyError:
+                return default
+
+            if time.time() > expires:
+                del self.entries[key]
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Set a value, evicting the least recently used if full"""
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Remove a value, returns bool if it was cached"""
+        with self.lock:
+            return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        """Remove all values"""
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,219 @@
+"""Exports WSO search results to CSV, JSON Lines, Parquet or Arrow"""
+import os
+import csv
+import json
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Default device fields, nested fields are dotted
+DEVICE_FIELDS = [
+    "Id.Value", "SerialNumber", "DeviceFriendlyName", "LocationGroupId.Name",
+    "ModelId.Name", "Platform", "OperatingSystem", "Ownership", "UserName",
+    "EnrollmentStatus", "LastSeen"
+]
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet", "arrow")
+
+
+def get_field(record, field):
+    """Gets a dotted field from a record, returns None if missing"""
+    value = record
+    for key in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+
+    return value
+
+
+def flatten(record, fields):
+    """Returns a list of the fields of a record, nested values are
+       converted to json"""
+    row = []
+    for field in fields:
+        value = get_field(record, field)
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        row.append(value)
+
+    return row
+
+
+def export_format(path):
+    """Gets the export format from a file extension, returns None
+       if it's not supported"""
+    extension = path.rsplit(".", 1)[-1].lower()
+
+    if extension == "json":
+        extension = "jsonl"
+    elif extension in ("feather", "ipc"):
+        extension = "arrow"
+
+    if extension in EXPORT_FORMATS:
+        return extension
+
+    return None
+
+
+def write_csv(records, fields, path):
+    """Writes records to a CSV file, returns the number written"""
+    count = 0
+    with open(path, "w", newline="") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(fields)
+
+        for record in records:
+            writer.writerow(flatten(record, fields))
+            count += 1
+
+    return count
+
+
+def write_jsonl(records, fields, path):
+    """Writes records to a JSON Lines file with the fields as
+       flat keys, returns the number written"""
+    count = 0
+    with open(path, "w") as outfile:
+        for record in records:
+            outfile.write(json.dumps(dict(zip(fields, flatten(record,
+                                                              fields)))))
+            outfile.write("\n")
+            count += 1
+
+    return count
+
+
+def string_array(values):
+    """Converts values to an Arrow string array, non strings are
+       written as json so they match Arrow's own casts"""
+    return pyarrow.array(
+        [value if value is None or isinstance(value, str) else
+         json.dumps(value) for value in values],
+        type=pyarrow.string())
+
+
+def arrow_batch(rows, fields, schema=None):
+    """Converts rows to an Arrow record batch, columns are typed
+       from the schema or inferred. Columns of unknown or mixed types,
+       or that don't fit the schema, become strings"""
+    columns = []
+    for i, field in enumerate(fields):
+        values = [row[i] for row in rows]
+
+        try:
+            if schema is not None:
+                column = pyarrow.array(values, type=schema.field(i).type)
+            else:
+                column = pyarrow.array(values)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            column = string_array(values)
+
+        if pyarrow.types.is_null(column.type):
+            column = column.cast(pyarrow.string())
+        columns.append(column)
+
+    return pyarrow.RecordBatch.from_arrays(columns, names=fields)
+
+
+def unify_schema(schema, other):
+    """Returns schema with the columns that differ in other as strings"""
+    return pyarrow.schema([
+        field if field.type == other.field(i).type else
+        pyarrow.field(field.name, pyarrow.string())
+        for i, field in enumerate(schema)
+    ])
+
+
+def cast_batch(batch, schema):
+    """Casts a record batch to schema"""
+    return pyarrow.RecordBatch.from_arrays(
+        [column.cast(field.type) for column, field in zip(batch.columns,
+                                                          schema)],
+        schema=schema)
+
+
+def read_batches(path, file_format):
+    """Generator of the record batches in a Parquet or Arrow IPC file"""
+    if file_format == "parquet":
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            yield batch
+    else:
+        with pyarrow.ipc.open_file(path) as reader:
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+def write_arrow(records, fields, path, file_format="parquet",
+                batch_size=10000):
+    """Writes records to a Parquet or Arrow IPC file in batches,
+       returns the number written"""
+    if pyarrow is None:
+        raise ImportError("Parquet and Arrow exports require pyarrow, "
+                          "install it with pip install wso[export]")
+
+    count = 0
+    writer = None
+    schema = None
+    rows = []
+
+    # Where the file is being written, changes if it's rewritten
+    target = path
+
+    def open_writer(write_path):
+        if file_format == "parquet":
+            return pyarrow.parquet.ParquetWriter(write_path, schema)
+        return pyarrow.ipc.new_file(write_path, schema)
+
+    def write(batch):
+        if file_format == "parquet":
+            writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+
+    def write_batch():
+        nonlocal writer, schema, target
+
+        # Later batches use the types inferred from the first
+        batch = arrow_batch(rows, fields, schema)
+
+        if writer is None:
+            schema = batch.schema
+            writer = open_writer(target)
+        elif batch.schema != schema:
+            # A column changed type, rewrite what's written as strings
+            written = target
+            schema = unify_schema(schema, batch.schema)
+            writer.close()
+
+            target = "%s.%i.tmp" % (path, count)
+            writer = open_writer(target)
+            for old_batch in read_batches(written, file_format):
+                write(cast_batch(old_batch, schema))
+            os.remove(written)
+
+        write(cast_batch(batch, schema))
+
+    try:
+        for record in records:
+            rows.append(flatten(record, fields))
+            count += 1
+
+            if len(rows) >= batch_size:
+                write_batch()
+                rows = []
+
+        if rows or writer is None:
+            write_batch()
+    finally:
+        if writer is not None:
+            writer.close()
+
+        if target != path:
+            os.replace(target, path)
+
+    return count
@@ -0,0 +1,383 @@
+"""Local inventory caches used by WSO"""
+import os
+import json
+import time
+import threading
+
+# Device keys indexed, named after the WSO searchBy values
+DEVICE_INDEXES = {
+    "DeviceId": "Id",
+    "Serialnumber": "SerialNumber",
+    "Udid": "Udid",
+    "Macaddress": "MacAddress",
+    "ImeiNumber": "Imei"
+}
+
+
+class DeviceInventory():
+    """Device cache indexed by ID, serial, UDID, MAC and IMEI.
+       Entries expire ttl seconds after the last refresh that kept them,
+       a full refresh is due every full_ttl seconds to drop old devices"""
+    def __init__(self, ttl=3600, path=None, full_ttl=86400):
+        self.ttl = ttl
+        self.full_ttl = full_ttl
+        self.path = path
+
+        # Device ID => (time added, device)
+        self.devices = {}
+
+        # searchBy => {value => device ID}
+        self.indexes = {}
+        for id_type in DEVICE_INDEXES:
+            self.indexes[id_type] = {}
+
+        # Time of the last refresh and full refresh from the API
+        self.last_refresh = None
+        self.last_full_refresh = None
+
+        self.lock = threading.Lock()
+
+        if self.path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self.devices)
+
+    @staticmethod
+    def normalise(id_type, value):
+        """Normalise a value so lookups are not format sensitive"""
+        value = str(value)
+
+        if id_type == "Macaddress":
+            return value.replace(":", "").replace("-", "").upper()
+
+        return value.upper()
+
+    @staticmethod
+    def device_value(device, id_type):
+        """Gets the value of an id_type from a device"""
+        value = device.get(DEVICE_INDEXES[id_type])
+
+        # Device IDs are nested as {"Value": id}
+        if isinstance(value, dict):
+            value = value.get("Value")
+
+        return value
+
+    def add(self, devices, added=None):
+        """Add or update devices, returns the number added"""
+        if added is None:
+            added = time.time()
+
+        count = 0
+        for device in devices:
+            device_id = self.device_value(device, "DeviceId")
+            if device_id is None:
+                continue
+
+            # Lock per device, devices may be a generator still paging
+            with self.lock:
+                self.unindex(device_id)
+                self.devices[device_id] = (added, device)
+
+                for id_type, index in self.indexes.items():
+                    value = self.device_value(device, id_type)
+                    if value not in (None, ""):
+                        index[self.normalise(id_type, value)] = device_id
+
+            count += 1
+
+        return count
+
+    def touch(self, added):
+        """Marks all devices current as of added, used after an
+           incremental refresh which only returns the changed devices"""
+        with self.lock:
+            for device_id, (previous, device) in self.devices.items():
+                if previous < added:
+                    self.devices[device_id] = (added, device)
+
+    def prune(self, before):
+        """Remove devices last added before a time, used after a full
+           refresh to drop devices it didn't return. Returns the number
+           removed"""
+        with self.lock:
+            stale = [
+                device_id
+                for device_id, (added, device) in self.devices.items()
+                if added < before
+            ]
+            for device_id in stale:
+                self.unindex(device_id)
+                del self.devices[device_id]
+
+        return len(stale)
+
+    def unindex(self, device_id):
+        """Remove a device from the indexes, lock must be held"""
+        if device_id not in self.devices:
+            return
+
+        device = self.devices[device_id][1]
+        for id_type, index in self.indexes.items():
+            value = self.device_value(device, id_type)
+            if value not in (None, ""):
+                index.pop(self.normalise(id_type, value), None)
+
+    def remove(self, device_id):
+        """Remove a device from the inventory"""
+        with self.lock:
+            self.unindex(device_id)
+            self.devices.pop(device_id, None)
+
+    def get(self, id_type, value):
+        """Get a device by searchBy type and value, returns None on a miss
+           or if the entry has expired"""
+        if id_type not in self.indexes:
+            return None
+
+        with self.lock:
+            device_id = self.indexes[id_type].get(self.normalise(
+                id_type, value))
+            if device_id is None:
+                return None
+
+            added, device = self.devices[device_id]
+            if time.time() - added > self.ttl:
+                # Expired, drop it so the caller goes back to the API
+                self.unindex(device_id)
+                del self.devices[device_id]
+                return None
+
+        return device
+
+    def index(self, id_type="Serialnumber"):
+        """Returns a dict of value => device for unexpired devices,
+           compatible with WSO.index_devices()"""
+        now = time.time()
+
+        with self.lock:
+            index = {}
+            for added, device in self.devices.values():
+                value = self.device_value(device, id_type)
+                if now - added <= self.ttl and value not in (None, ""):
+                    index[str(value)] = device
+
+        return index
+
+    def expired(self):
+        """Checks if the inventory is due a refresh"""
+        return self.last_refresh is None or \
+            time.time() - self.last_refresh > self.ttl
+
+    def full_due(self):
+        """Checks if the next refresh should be a full refresh"""
+        return self.last_full_refresh is None or \
+            time.time() - self.last_full_refresh > self.full_ttl
+
+    def clear(self):
+        """Remove all devices"""
+        with self.lock:
+            self.devices = {}
+            for id_type in self.indexes:
+                self.indexes[id_type] = {}
+            self.last_refresh = None
+            self.last_full_refresh = None
+
+    def save(self):
+        """Write the inventory to path"""
+        if self.path is None:
+            return False
+
+        with self.lock:
+            data = {}
+            data['LastRefresh'] = self.last_refresh
+            data['LastFullRefresh'] = self.last_full_refresh
+            data['Devices'] = [[added, device]
+                               for added, device in self.devices.values()]
+
+        with open(self.path, 'w') as outfile:
+            json.dump(data, outfile)
+
+        return True
+
+    def load(self):
+        """Read the inventory from path"""
+        if self.path is None or not os.path.isfile(self.path):
+            return False
+
+        try:
+            with open(self.path) as infile:
+                data = json.load(infile)
+        except ValueError:
+            return False
+
+        for added, device in data['Devices']:
+            self.add([device], added)
+        self.last_refresh = data['LastRefresh']
+        self.last_full_refresh = data.get('LastFullRefresh')
+
+        return True
+
+
+# OG keys indexed, names are not unique so map to a list of OGs
+OG_INDEXES = ("Id", "Uuid", "GroupId", "Name")
+
+
+class OGIndex():
+    """OG hierarchy cache indexed by ID, UUID, group ID and name with
+       parent and child links. Due a reload ttl seconds after loading"""
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+
+        # OG ID => OG
+        self.ogs = {}
+
+        # Index key => {value => [OG IDs]}
+        self.indexes = {}
+        for key in OG_INDEXES:
+            self.indexes[key] = {}
+
+        # Parent OG ID => [child OG IDs]
+        self.children = {}
+
+        # Time of the last load from the API
+        self.last_refresh = None
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ogs)
+
+    @staticmethod
+    def parent_id(org_group):
+        """Gets the parent OG ID, it's nested as {"Id": id} or
+           {"Id": {"Value": id}} depending on the API version"""
+        parent = org_group.get("ParentLocationGroup")
+
+        if isinstance(parent, dict):
+            parent = parent.get("Id")
+        if isinstance(parent, dict):
+            parent = parent.get("Value")
+
+        return parent
+
+    def load(self, ogs, loaded=None):
+        """Replace the index with ogs, returns the number loaded"""
+        if loaded is None:
+            loaded = time.time()
+
+        self.clear()
+        count = self.add(ogs)
+        self.last_refresh = loaded
+
+        return count
+
+    def add(self, ogs):
+        """Add or update OGs, returns the number added"""
+        count = 0
+        with self.lock:
+            for org_group in ogs:
+                og_id = org_group.get("Id")
+                if og_id is None:
+                    continue
+
+                self.unindex(og_id)
+                self.ogs[og_id] = org_group
+
+                for key, index in self.indexes.items():
+                    value = org_group.get(key)
+                    if value not in (None, ""):
+                        index.setdefault(str(value), []).append(og_id)
+
+                parent = self.parent_id(org_group)
+                if parent is not None:
+                    self.children.setdefault(parent, []).append(og_id)
+
+                count += 1
+
+        return count
+
+    def unindex(self, og_id):
+        """Remove an OG from the indexes, lock must be held"""
+        if og_id not in self.ogs:
+            return
+
+        org_group = self.ogs[og_id]
+        for key, index in self.indexes.items():
+            value = org_group.get(key)
+            if value not in (None, "") and str(value) in index:
+                index[str(value)].remove(og_id)
+                if not index[str(value)]:
+                    del index[str(value)]
+
+        parent = self.parent_id(org_group)
+        if og_id in self.children.get(parent, []):
+            self.children[parent].remove(og_id)
+
+    def remove(self, key, value):
+        """Remove the OGs matching a key and value, returns the number
+           removed"""
+        with self.lock:
+            og_ids = list(self.indexes[key].get(str(value), []))
+            for og_id in og_ids:
+                self.unindex(og_id)
+                del self.ogs[og_id]
+
+        return len(og_ids)
+
+    def find(self, key, value):
+        """Returns a list of OGs matching a key and value"""
+        with self.lock:
+            return [
+                self.ogs[og_id]
+                for og_id in self.indexes[key].get(str(value), [])
+            ]
+
+    def get(self, key, value):
+        """Returns the first OG matching a key and value, None on a miss"""
+        ogs = self.find(key, value)
+        if ogs:
+            return ogs[0]
+
+        return None
+
+    def get_parent(self, og_id):
+        """Returns the parent of an OG, None for the top OG or a miss"""
+        with self.lock:
+            org_group = self.ogs.get(og_id)
+            if org_group is None:
+                return None
+
+            return self.ogs.get(self.parent_id(org_group))
+
+    def get_children(self, og_id):
+        """Returns the child OGs of an OG"""
+        with self.lock:
+            return [
+                self.ogs[child] for child in self.children.get(og_id, [])
+            ]
+
+    def index(self, key="Name"):
+        """Returns a dict of value => OG, compatible with
+           WSO.index_ogs()"""
+        with self.lock:
+            index = {}
+            for value, og_ids in self.indexes[key].items():
+                index[value] = self.ogs[og_ids[0]]
+
+        return index
+
+    def expired(self):
+        """Checks if the index is due a reload"""
+        return self.last_refresh is None or \
+            time.time() - self.last_refresh > self.ttl
+
+    def clear(self):
+        """Remove all OGs"""
+        with self.lock:
+            self.ogs = {}
+            for key in self.indexes:
+                self.indexes[key] = {}
+            self.children = {}
+            self.last_refresh = None
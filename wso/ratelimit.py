@@ -0,0 +1,123 @@
+"""Rate limit scheduling for the WSO API"""
+import time
+import threading
+from collections import deque
+
+from requests.adapters import HTTPAdapter
+
+
+class RateLimiter():
+    """Token bucket fed by the X-RateLimit response headers.
+       Requests are only paced once the observed rate would use up the
+       remaining calls before the limit resets"""
+    def __init__(self, reserve=0, burst=10, window=60):
+        # Number of calls to keep spare for other API users
+        self.reserve = reserve
+
+        # Max number of requests to allow at once when pacing
+        self.burst = burst
+
+        # Seconds of history used to measure the request rate
+        self.window = window
+
+        self.remaining = None
+        self.limit = None
+        self.reset = None
+
+        self.tokens = burst
+        self.updated = time.time()
+        self.history = deque()
+
+        self.lock = threading.Lock()
+
+    def update(self, headers):
+        """Update the budget from response headers, returns bool"""
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            limit = int(headers['X-RateLimit-Limit'])
+            reset = int(headers['X-RateLimit-Reset'])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        with self.lock:
+            self.remaining = remaining
+            self.limit = limit
+            self.reset = reset
+
+        return True
+
+    def observed_rate(self, now):
+        """Requests per second over the window, lock must be held"""
+        while self.history and now - self.history[0] > self.window:
+            self.history.popleft()
+
+        # Average over the whole window so short bursts aren't projected
+        return len(self.history) / self.window
+
+    def acquire(self):
+        """Wait until a request can be made, returns the seconds waited"""
+        with self.lock:
+            now = time.time()
+            wait = 0.0
+
+            if self.remaining is not None and self.reset is not None:
+                until_reset = max(self.reset - now, 1)
+                available = self.remaining - self.reserve
+
+                if available <= 0:
+                    # Out of calls, wait for the limit to reset
+                    wait = until_reset
+                    self.tokens = self.burst
+                elif self.observed_rate(now) * until_reset > available:
+                    # Spread the remaining calls out until the reset
+                    rate = available / until_reset
+                    self.tokens = min(self.burst,
+                                      self.tokens + (now - self.updated) * rate)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                    else:
+                        wait = (1 - self.tokens) / rate
+                        self.tokens = 0
+
+                # Count the call until the headers say otherwise
+                self.remaining -= 1
+
+            self.updated = now + wait
+            self.history.append(now + wait)
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    def budget(self):
+        """Returns the current budget and when it's projected to run out"""
+        with self.lock:
+            now = time.time()
+            rate = self.observed_rate(now)
+
+            budget = {}
+            budget['Remaining'] = self.remaining
+            budget['Limit'] = self.limit
+            budget['Reset'] = self.reset
+            budget['Rate'] = rate
+            budget['Exhaustion'] = None
+
+            if self.remaining is not None and rate > 0:
+                budget['Exhaustion'] = now + self.remaining / rate
+
+        return budget
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that schedules each request through a RateLimiter"""
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        response = super().send(request, **kwargs)
+        self.limiter.update(response.headers)
+
+        return response
@@ -0,0 +1,121 @@
+"""Incremental JSON decoding of WSO search responses"""
+import json
+import codecs
+
+WHITESPACE = " \t\n\r"
+
+
+class JSONArrayStream():
+    """Decodes one array of a top level JSON object from chunks of bytes,
+       yielding the array items as they arrive. The other top level
+       values, e.g. Page and Total, are stored in meta"""
+    def __init__(self, chunks, key):
+        self.chunks = iter(chunks)
+        self.key = key
+        self.meta = {}
+
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read(self):
+        """Adds the next chunk to the buffer, returns False at the end"""
+        if self.eof:
+            return False
+
+        # Drop the decoded part of the buffer
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += self.utf8.decode(chunk)
+                return True
+
+        self.buffer += self.utf8.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Returns the next non whitespace character, None at the end"""
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self.read():
+                return None
+
+    def expect(self, characters):
+        """Consumes one of characters, returns it"""
+        character = self.peek()
+        if character is None or character not in characters:
+            raise ValueError("Expected %s at %i, got %s" %
+                             (characters, self.pos, character))
+
+        self.pos += 1
+        return character
+
+    def value(self):
+        """Decodes the next value, reading more until it is complete"""
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+
+                # A number at the end of the buffer may be incomplete
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.decoder.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            self.read()
+
+    def __iter__(self):
+        self.expect("{")
+
+        if self.peek() == "}":
+            return
+
+        while True:
+            name = self.value()
+            self.expect(":")
+
+            if name == self.key and self.peek() == "[":
+                self.pos += 1
+
+                if self.peek() != "]":
+                    while True:
+                        yield self.value()
+                        if self.expect(",]") == "]":
+                            break
+                else:
+                    self.pos += 1
+
+                self.meta[name] = None
+            else:
+                self.meta[name] = self.value()
+
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_json_array(chunks, key, meta=None):
+    """Generator of the items in the key array of a JSON object read
+       from chunks of bytes, other top level values are added to meta"""
+    stream = JSONArrayStream(chunks, key)
+
+    try:
+        for item in stream:
+            yield item
+    finally:
+        if meta is not None:
+            meta.update(stream.meta)
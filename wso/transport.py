@@ -0,0 +1,41 @@
+"""Shared HTTP transport for the WSO API versions"""
+
+
+class VersionedSession():
+    """Sends requests through a shared requests.Session with the
+       Accept header of one API version, used as REST.sessions"""
+    def __init__(self, session, version):
+        self.session = session
+        self.version = version
+        self.headers = {'Accept': "application/json;version=%s" % version}
+
+    def request(self, method, url, **kwargs):
+        """HTTP request with the version header"""
+        headers = dict(self.headers)
+        headers.update(kwargs.pop('headers', None) or {})
+
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        """HTTP GET"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """HTTP POST"""
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        """HTTP PUT"""
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """HTTP DELETE"""
+        return self.request('DELETE', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        """HTTP PATCH"""
+        return self.request('PATCH', url, **kwargs)
+
+    def close(self):
+        """Close the shared session"""
+        self.session.close()
@@ -1,11 +1,14 @@
 """A collection of utilities used in WSO"""
+import os
 import sys
 import json
+import threading
 import pkg_resources
 from basic_auth import Auth
 
 CONFIG_FILES = {
     "application_state": "device_application_status.json",
+    "countries": "countries.json",
     "device_models": "device_models.json",
     "device_ownership": "device_ownership.json",
     "locales": "locale.json",
@@ -14,34 +17,87 @@ CONFIG_FILES = {
     "timezones": "timezones.json"
 }
 
+# Tables and indexes are loaded on first use and shared by all Utils
+TABLES = {}
+INDEXES = {}
+TABLE_LOCK = threading.Lock()
+
 
 class Utils:
     "WSO utils"
 
     def __init__(self):
+        path = 'system_parameters/'  # always use slash
+        self.filepath = pkg_resources.resource_filename(__name__, path)
+
         for file in CONFIG_FILES:
-            path = 'system_parameters/'  # always use slash
-            filepath = pkg_resources.resource_filename(__name__, path)
-            if not Auth(config_dir=filepath).check_file_exists(
+            if not Auth(config_dir=self.filepath).check_file_exists(
                     CONFIG_FILES[file]):
                 sys.exit("Unable to load file %s/%s" %
-                         (filepath, CONFIG_FILES[file]))
+                         (self.filepath, CONFIG_FILES[file]))
+
+    def load_table(self, file):
+        """Loads the rows of a system parameters file, once per process"""
+        if file not in TABLES:
+            with TABLE_LOCK:
+                if file not in TABLES:
+                    with open(os.path.join(self.filepath,
+                                           CONFIG_FILES[file])) as json_file:
+                        keys = json.load(json_file)
+
+                    # The rows are nested under a single key
+                    rows = []
+                    for key in keys:
+                        rows.extend(keys[key])
+                    TABLES[file] = rows
+
+        return TABLES[file]
+
+    def index_table(self, t_key, file):
+        """Returns a dict of t_key => row for a file, built once per process"""
+        if (file, t_key) not in INDEXES:
+            index = {}
+
+            # Reversed so the first row wins on duplicates
+            for row in reversed(self.load_table(file)):
+                index[row[t_key]] = row
+
+            with TABLE_LOCK:
+                INDEXES[(file, t_key)] = index
+
+        return INDEXES[(file, t_key)]
 
     def check_key(self, t_key, value, file):
         """A varible function to check the keys of a json for a value"""
-        with open("wso/system_parameters/" + CONFIG_FILES[file]) as json_file:
-            keys = json.load(json_file)
+        try:
+            return value in self.index_table(t_key, file)
 
-        for key in keys:
-            for nested_key in keys[key]:
-                if value == nested_key[t_key]:
-                    return True
-        return False
+        # Unhashable values can't be in the file
+        except TypeError:
+            return False
+
+    def lookup_key(self, t_key, value, r_key, file):
+        """Finds the row where t_key is value and returns its r_key,
+           returns None if there isn't one"""
+        if not self.check_key(t_key, value, file):
+            return None
+
+        return self.index_table(t_key, file)[value][r_key]
 
-    # TODO Complete funcitons
     def check_countries(self, country):
-        """Check if a country is valid"""
-        pass
+        """Check if a country name or ID is valid"""
+        return self.check_key("country_name", country, 'countries') or \
+            self.check_key("country_id", country, 'countries')
+
+    def lookup_country(self, country_id):
+        """Lookup a country name from its ID"""
+        return self.lookup_key("country_id", country_id, "country_name",
+                               'countries')
+
+    def get_country_id(self, country):
+        """Get the ID of a country name"""
+        return self.lookup_key("country_name", country, "country_id",
+                               'countries')
 
     def check_timezone(self, timezone):
         """Check if a timezone code is valid"""
@@ -53,32 +109,58 @@ class Utils:
 
     def lookup_application_status(self, status):
         """Lookup an application status from its ID"""
-        pass
+        return self.lookup_key("id", status, "status", 'application_state')
+
+    def get_application_status_id(self, status):
+        """Get the ID of an application status"""
+        return self.lookup_key("status", status, "id", 'application_state')
 
     def check_operating_system_id(self, os_id):
         """Checks an OS ID is valid"""
-        pass
+        return self.check_key("os_id", os_id, 'os_ids')
 
     def lookup_operating_system(self, os_id):
         """Lookup an operating system from its ID"""
-        pass
+        return self.lookup_key("os_id", os_id, "device_os", 'os_ids')
+
+    def get_operating_system_id(self, device_os):
+        """Get the ID of an operating system"""
+        return self.lookup_key("device_os", device_os, "os_id", 'os_ids')
 
     def check_device_model(self, dm_id):
         """Checks a device ID is valid"""
-        pass
+        return self.check_key("model", dm_id, 'device_models')
 
     def lookup_device_model(self, dm_id):
         """Lookup a device model from its ID"""
-        pass
+        return self.lookup_key("model", dm_id, "device_model",
+                               'device_models')
+
+    def get_device_model_id(self, device_model):
+        """Get the ID of a device model"""
+        return self.lookup_key("device_model", device_model, "model",
+                               'device_models')
 
     def check_ownership_type(self, o_type):
-        """Checks an ownership type is valid"""
-        pass
+        """Checks an ownership type ID (C, S, E) or name is valid"""
+        return self.check_key("Ownership_ID", o_type, 'device_ownership') or \
+            self.check_key("Ownership_Type", o_type, 'device_ownership')
+
+    def lookup_ownership_type(self, o_type):
+        """Lookup an ownership type from its ID"""
+        return self.lookup_key("Ownership_ID", o_type, "Ownership_Type",
+                               'device_ownership')
 
     def check_platform_id(self, pid):
         """Checks a platform ID is valid"""
-        pass
+        return self.check_key("platform_id", pid, 'platforms')
 
     def lookup_platform_id(self, pid):
         """Lookup a platform from its ID"""
-        pass
+        return self.lookup_key("platform_id", pid, "platform_name",
+                               'platforms')
+
+    def get_platform_id(self, platform):
+        """Get the ID of a platform name"""
+        return self.lookup_key("platform_name", platform, "platform_id",
+                               'platforms')
@@ -1,13 +1,43 @@
 """WSO UEM package for managing large WSO instances"""
+import os
 import sys
 import json
 import time
 import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 from basic_auth import Auth
 from reqrest import REST
+from urllib3.util import Retry
 from wso.utilities import Utils
 from wso.configure import Config
+from wso.inventory import DeviceInventory, OGIndex, DEVICE_INDEXES
+from wso.cache import TTLCache
+from wso.ratelimit import RateLimiter, RateLimitedAdapter
+from wso.transport import VersionedSession
+from wso.stream import iter_json_array
+from wso import export
+
+
+class PagingError(Exception):
+    """Raised when a page fails part way through paging, so a partial
+       result isn't mistaken for the full result"""
+
+
+class LazyArgs():
+    """Function args for logging, only filtered and formatted if
+       the log record is emitted"""
+    def __init__(self, _locals):
+        self._locals = _locals
+
+    def __str__(self):
+        return str({
+            key: value
+            for key, value in self._locals.items() if key != "self"
+        })
 
 
 class WSO():
@@ -16,7 +46,9 @@ class WSO():
                  config_dir="config",
                  config_file="uem.json",
                  debug=False,
-                 bulk_query_trigger=50):
+                 bulk_query_trigger=50,
+                 max_workers=4,
+                 pool_size=10):
 
         # Sort out logging
         log_level = logging.ERROR
@@ -32,6 +64,7 @@ class WSO():
         self.warning = logging.warning
         self.error = logging.error
         self.critical = logging.critical
+        self.log_enabled = logging.getLogger().isEnabledFor
 
         # Show sensitve info such as auth headers
         self.show_sensitive = False
@@ -39,9 +72,39 @@ class WSO():
         # Set max size line to log
         self.max_log = 9000
 
-        # Set a limit of when to swtich to bulk querys
+        # Set a limit of when to swtich to bulk querys, auto picks
+        # using the measured latency and the fleet size
         self.bulk_query_trigger = bulk_query_trigger
 
+        # Moving average of request seconds by (path, pagesize), only
+        # for the paths the device query cost model uses
+        self.latency = {}
+        self.latency_lock = threading.Lock()
+        self.latency_paths = ('/api/mdm/devices', '/api/mdm/devices/search')
+
+        # Seconds assumed per request and per device in a search page
+        # until the latency has been measured
+        self.default_latency = 0.5
+        self.default_device_latency = 0.002
+
+        # (time fetched, device count) used by the auto bulk_query_trigger
+        self.fleet = None
+
+        # Set the number of items per bulk request if there's no limit
+        self.bulk_chunk_size = 500
+
+        # Console bulk limits, loaded on first use by get_bulk_limit()
+        self.bulk_settings = None
+
+        # Set the page size used when downloading everything
+        self.bulk_pagesize = 5000
+
+        # Set the bytes read at a time when streaming responses
+        self.stream_chunk_size = 65536
+
+        # Set the number of requests that can be in flight at once
+        self.max_workers = max_workers
+
         # Get config
         self.config_dir = config_dir
 
@@ -72,36 +135,38 @@ class WSO():
                 self.critical("Run again to use config")
                 sys.exit(1)
 
-        self.info("Imported config - %s" % self.info_sensitive(self.config))
+        self.info("Imported config - %s", self.info_sensitive(self.config))
 
-        # Create v1 API object
-        headers_v1 = self.create_headers(version=1)
+        self.proxy = self.import_proxy()
 
-        self.rest_v1 = REST(url=self.config['url'],
-                            headers=headers_v1,
-                            proxy=self.import_proxy(),
-                            debug=debug,
-                            timeout=9999)
+        # Schedule every request through the rate limiter
+        self.rate_limiter = RateLimiter()
 
-        # Create v2 API object
-        headers_v2 = self.create_headers(version=2)
+        # One pooled keep-alive session is shared by all API versions
+        self.session = self.create_session(pool_size)
 
-        self.rest_v2 = REST(url=self.config['url'],
-                            headers=headers_v2,
-                            proxy=self.import_proxy(),
-                            debug=debug,
-                            timeout=9999)
+        # Create v1, v2 and v3 API objects
+        self.rest_v1 = self.create_rest(1, debug)
+        self.rest_v2 = self.create_rest(2, debug)
+        self.rest_v3 = self.create_rest(3, debug)
 
-        # Create v3 API object
-        headers_v3 = self.create_headers(version=2)
+        self.utils = Utils()
 
-        self.rest_v3 = REST(url=self.config['url'],
-                            headers=headers_v3,
-                            proxy=self.import_proxy(),
-                            debug=debug,
-                            timeout=9999)
+        # Local device inventory, opt in with enable_inventory()
+        self.inventory = None
 
-        self.utils = Utils()
+        # One thread refreshes the inventory at a time, a failed refresh
+        # isn't retried for inventory_retry seconds
+        self.inventory_lock = threading.Lock()
+        self.inventory_retry = 300
+        self.inventory_failed = None
+
+        # OG hierarchy index, loaded on first use by get_og_index()
+        self.og_index = None
+        self.og_index_ttl = 3600
+
+        # Product and smart group ID => name
+        self.name_cache = TTLCache(maxsize=1024, ttl=300)
 
     def configure(self):
         """Interactive setup of config"""
@@ -124,8 +189,8 @@ class WSO():
             'Content-Type': "application/json"
         }
 
-        self.info("Generated v%i headers - %s" %
-                  (version, self.info_sensitive(headers)))
+        self.info("Generated v%i headers - %s", version,
+                  self.info_sensitive(headers))
 
         return headers
 
@@ -137,8 +202,8 @@ class WSO():
         # Try to read the proxy settings, if the key doesn't exist
         # assume no proxy is used
         try:
-            self.debug("Using proxy %s:%s" %
-                       (self.config['proxyserver'], self.config['proxyport']))
+            self.debug("Using proxy %s:%s", self.config['proxyserver'],
+                       self.config['proxyport'])
             proxies = {
                 'http':
                 '%s:%s' %
@@ -151,12 +216,51 @@ class WSO():
             self.debug("No proxy config found")
             proxies = None
 
-        self.info("Generated proxy config - %s" % proxies)
+        self.info("Generated proxy config - %s", proxies)
         return proxies
 
+    def create_session(self, pool_size=10):
+        """Creates the pooled session shared by the API versions, requests
+           are paced by the rate limiter which reads the X-RateLimit headers"""
+        session = requests.Session()
+
+        # The Accept version header is added per request by VersionedSession
+        headers = self.create_headers()
+        del headers['Accept']
+        session.headers.update(headers)
+
+        # Same retries as REST, plus backing off on 429
+        retries = Retry(total=5,
+                        backoff_factor=1,
+                        status_forcelist=[429, 502, 503, 504])
+
+        session.mount(
+            'https://',
+            RateLimitedAdapter(self.rate_limiter,
+                               pool_connections=pool_size,
+                               pool_maxsize=pool_size,
+                               max_retries=retries))
+
+        return session
+
+    def create_rest(self, version, debug=False):
+        """Creates a REST API object for a version using the shared session"""
+        rest = REST(url=self.config['url'],
+                    proxy=self.proxy,
+                    debug=debug,
+                    timeout=9999)
+
+        # Swap the REST session for the shared one
+        rest.sessions.close()
+        rest.sessions = VersionedSession(self.session, version)
+
+        self.info("Created v%i API object", version)
+
+        return rest
+
     def check_http_response(self, response, expected_code=None):
         """Checks if response is a expected or a known good response"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         status_codes = {}
         status_codes[200] = True, 'HTTP 200: OK'
@@ -185,17 +289,18 @@ class WSO():
 
         # Unable to find code return False
         else:
-            self.error('Unknown code %s' % response.status_code)
+            self.error('Unknown code %s', response.status_code)
             return False
 
     def str_to_json(self, string):
         """Tries to convert str to json dict, returns None on failure"""
         # If the args are too large don't display in the logger
-        if sys.getsizeof(string) > self.max_log:
-            self.info("args exceed max display size: %s" %
-                      sys.getsizeof(string))
-        else:
-            self.info("args: %s" % self.filter_locals(locals()))
+        if self.log_enabled(logging.INFO):
+            if sys.getsizeof(string) > self.max_log:
+                self.info("args exceed max display size: %s",
+                          sys.getsizeof(string))
+            else:
+                self.info("args: %s", LazyArgs(locals()))
         # Convert into json, catch the exception
         try:
             converted = json.loads(string)
@@ -211,38 +316,44 @@ class WSO():
     def querystring(self, **kwargs):
         """Turns args into a querystring"""
         # kwargs is already in the right format just return that
-        self.info("Kwargs - %s" % kwargs)
+        self.info("Kwargs - %s", kwargs)
 
         for key, value in dict(kwargs).items():
             if value is None:
                 del kwargs[key]
 
-        self.info("Filtered args: %s" % kwargs)
+        self.info("Filtered args: %s", kwargs)
 
         return kwargs
 
     def simple_get(self, path, querystring=None, version=2):
         """Simple HTTP get given a path"""
         # If the args are too large don't display in the logger
-        if sys.getsizeof(self.filter_locals(locals())) > self.max_log:
-            self.info("args exceed max display size %s" %
-                      sys.getsizeof(self.filter_locals(locals())))
-        else:
-            self.info("args: %s" % self.filter_locals(locals()))
+        # only size and format them if they will be logged
+        if self.log_enabled(logging.INFO):
+            args = self.filter_locals(locals())
+            if sys.getsizeof(args) > self.max_log:
+                self.info("args exceed max display size %s",
+                          sys.getsizeof(args))
+            else:
+                self.info("args: %s", args)
 
         # Query API
+        started = time.time()
         if version == 2:
             response = self.rest_v2.get(path, querystring=querystring)
         else:
             response = self.rest_v1.get(path, querystring=querystring)
+        self.record_latency(path, querystring, time.time() - started)
 
         # If the response is too large don't display in the logger
-        size = sys.getsizeof(response.text)
+        if self.log_enabled(logging.INFO):
+            size = sys.getsizeof(response.text)
 
-        if size > self.max_log:
-            self.info("Response body exceed max display size %s" % size)
-        else:
-            self.info("Response body - %s" % response.text)
+            if size > self.max_log:
+                self.info("Response body exceed max display size %s", size)
+            else:
+                self.info("Response body - %s", response.text)
 
         # Check response and return validated data
         check = self.check_http_response(response)
@@ -256,26 +367,160 @@ class WSO():
 
         return False
 
+    def stream_get(self, path, key, querystring=None, version=2, meta=None):
+        """HTTP get that decodes the key array of the response as it is
+           downloaded, yields one record at a time. The other top level
+           values such as Total are added to meta. Raises PagingError
+           if the request fails"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        rest = self.rest_v2 if version == 2 else self.rest_v1
+
+        response = rest.sessions.get(rest.protocol + '://' + rest.url + path,
+                                     proxies=rest.proxies,
+                                     timeout=rest.timeout,
+                                     params=querystring,
+                                     stream=True)
+
+        try:
+            # 204 is no content, no results found
+            if response.status_code == 204:
+                return
+
+            if not self.check_http_response(response):
+                self.error("Unable to stream %s", path)
+                raise PagingError("Unable to stream %s" % path)
+
+            try:
+                for record in iter_json_array(
+                        response.iter_content(
+                            chunk_size=self.stream_chunk_size), key, meta):
+                    yield record
+            except (ValueError, requests.exceptions.RequestException) as err:
+                # A dropped connection or truncated body
+                self.error("Stream of %s failed: %s", path, err)
+                raise PagingError("Stream of %s failed" % path)
+        finally:
+            response.close()
+
+    def stream_pages(self, path, key, querystring=None, version=2,
+                     pagesize=500):
+        """Streaming version of iter_pages, pages are fetched in turn
+           and decoded as they are downloaded so only one record is
+           held in memory at a time"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        querystring = dict(querystring or {})
+        querystring['pagesize'] = pagesize
+
+        page = 0
+        count = pagesize
+
+        # The total can be missing or stale, keep going until a short page
+        while count == pagesize:
+            querystring['page'] = page
+            count = 0
+
+            for record in self.stream_get(path, key, querystring, version):
+                count += 1
+                yield record
+
+            page += 1
+
+    def record_latency(self, path, querystring, seconds):
+        """Adds a request time to the moving average for the path, other
+           paths include IDs so aren't recorded"""
+        if path not in self.latency_paths:
+            return
+
+        pagesize = None
+        if querystring:
+            pagesize = querystring.get('pagesize')
+
+        with self.latency_lock:
+            average = self.latency.get((path, pagesize))
+            if average is None:
+                self.latency[(path, pagesize)] = seconds
+            else:
+                self.latency[(path, pagesize)] = average + 0.2 * (seconds -
+                                                                  average)
+
+    def measured_latency(self, path, pagesize=None):
+        """Returns the average request seconds for a path, None if it
+           hasn't been measured. Unmeasured page sizes are estimated as a
+           fixed cost per request plus a cost per device, fitted to the
+           measured page sizes"""
+        with self.latency_lock:
+            measured = {}
+            for key, average in self.latency.items():
+                if key[0] == path:
+                    measured[key[1]] = average
+
+        if not measured:
+            return None
+
+        if pagesize in measured:
+            return measured[pagesize]
+
+        sizes = [size for size in measured if size]
+        if pagesize is None or not sizes:
+            return sum(measured.values()) / len(measured)
+
+        if len(sizes) > 1:
+            # Least squares fit of the measured page sizes
+            mean_size = sum(sizes) / len(sizes)
+            mean_latency = sum(measured[size] for size in sizes) / len(sizes)
+            variance = sum((size - mean_size)**2 for size in sizes)
+            per_device = sum((size - mean_size) *
+                             (measured[size] - mean_latency)
+                             for size in sizes) / variance
+            per_device = max(per_device, 0)
+            fixed = max(mean_latency - per_device * mean_size, 0)
+        else:
+            # One page size, split it using the default device cost
+            size = sizes[0]
+            per_device = min(self.default_device_latency,
+                             measured[size] / size)
+            fixed = measured[size] - per_device * size
+
+        return fixed + per_device * pagesize
+
     def get_name(self, item_type, item_id):
         """Appends item_type and item_id to base\
-           URL and returns the Name key"""
-        self.info("args: %s" % self.filter_locals(locals()))
+           URL and returns the Name key, names are cached"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        name = self.name_cache.get((item_type, str(item_id)))
+        if name is not None:
+            return name
+
         response = self.rest_v1.get('/api/mdm/%s/%s' % (item_type, item_id))
 
         if self.check_http_response(response):
-            return self.str_to_json(response.text)['Name']
+            name = self.str_to_json(response.text)['Name']
+            self.name_cache.set((item_type, str(item_id)), name)
+            return name
         else:
-            self.error('Error gettting %s %s name' % (item_type, item_id))
+            self.error('Error gettting %s %s name', item_type, item_id)
             return False
 
+    def invalidate_name(self, item_type, item_id, name=None):
+        """Removes a cached name, or replaces it if name is set.
+           Use after renaming products or smart groups"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        self.name_cache.invalidate((item_type, str(item_id)))
+        if name is not None:
+            self.name_cache.set((item_type, str(item_id)), name)
+
     def get_product_name(self, product_id):
         """Resolves a product ID to name"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
         return self.get_name("products", product_id)
 
     def get_group_name(self, group_id):
         """Resolves a smartgroup ID to a name"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
         return self.get_name("smartgroups", group_id)
 
     def filter_locals(self, _locals):
@@ -291,6 +536,94 @@ class WSO():
 
         return _locals
 
+    def imap_concurrent(self, function, items):
+        """Runs function over items on a thread pool, yields the results
+           in order with at most max_workers calls in flight"""
+        items = iter(items)
+        futures = deque()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for item in items:
+                futures.append(executor.submit(function, item))
+                if len(futures) >= self.max_workers:
+                    break
+
+            while futures:
+                result = futures.popleft().result()
+
+                # Keep the pool full
+                for item in items:
+                    futures.append(executor.submit(function, item))
+                    break
+
+                yield result
+
+    def iter_pages(self, function, key, pagesize=500, **kwargs):
+        """Paging engine for search functions, reads the total from the
+           first page then fetches the remaining pages concurrently.
+           Yields one result at a time in order, key is the list in
+           the response or None if the function returns a list.
+           Raises PagingError if a page fails"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        def get_page(page):
+            response = function(pagesize=pagesize, page=page, **kwargs)
+
+            # 204 is no content, there are no more results
+            if response is None:
+                return []
+
+            if response is False:
+                self.error("Unable to get page %i of %s", page,
+                           function.__name__)
+                raise PagingError("Unable to get page %i of %s" %
+                                  (page, function.__name__))
+
+            if key is None:
+                return response
+            return response[key]
+
+        first = function(pagesize=pagesize, page=0, **kwargs)
+        if first is False:
+            self.error("Unable to get page 0 of %s", function.__name__)
+            raise PagingError("Unable to get page 0 of %s" %
+                              function.__name__)
+
+        if not first:
+            return
+
+        results = first if key is None else first[key]
+        for result in results:
+            yield result
+
+        if len(results) < pagesize:
+            return
+
+        # Search endpoints report the total under different keys
+        total = None
+        if key is not None:
+            total = first.get("Total", first.get("TotalResults"))
+
+        page = 1
+        if total:
+            last_page = -(-total // pagesize)
+            self.debug("Fetching pages 1 to %i of %s", last_page - 1,
+                       function.__name__)
+
+            for results in self.imap_concurrent(get_page,
+                                                range(1, last_page)):
+                for result in results:
+                    yield result
+
+            page = last_page
+
+        # The total can be missing or stale, keep going until a short page
+        while len(results) == pagesize:
+            results = get_page(page)
+            for result in results:
+                yield result
+            page += 1
+
     # System calls
 
     def remaining_api_calls(self):
@@ -303,17 +636,21 @@ class WSO():
         if self.check_http_response(response):
             for key in ("X-RateLimit-Remaining", "X-RateLimit-Limit",
                         "X-RateLimit-Reset"):
-                self.info("%s: %s" % (key, response.headers[key]))
+                self.info("%s: %s", key, response.headers[key])
 
             # Workout when the limit resets
-            self.info("Limit resets at %s" % time.strftime(
-                '%Y-%m-%d %H:%M:%S',
-                time.localtime(int(response.headers['X-RateLimit-Reset']))))
+            self.info(
+                "Limit resets at %s",
+                time.strftime(
+                    '%Y-%m-%d %H:%M:%S',
+                    time.localtime(int(
+                        response.headers['X-RateLimit-Reset']))))
 
             # Show what % of calls have been used
-            self.info("%s Used" % "{:.1%}".format(
-                1 - (int(response.headers['X-RateLimit-Remaining']) /
-                     int(response.headers['X-RateLimit-Limit']))))
+            self.info(
+                "%s Used", "{:.1%}".format(
+                    1 - (int(response.headers['X-RateLimit-Remaining']) /
+                         int(response.headers['X-RateLimit-Limit']))))
 
             return int(response.headers['X-RateLimit-Remaining'])
 
@@ -321,6 +658,20 @@ class WSO():
             self.error("Error getting response header")
             return False
 
+    def api_budget(self):
+        """The API calls remaining as seen on the last response, the
+           request rate and projected exhaustion time, returns dict"""
+        budget = self.rate_limiter.budget()
+
+        if budget['Exhaustion'] is not None and \
+                self.log_enabled(logging.INFO):
+            self.info(
+                "Calls projected to run out at %s",
+                time.strftime('%Y-%m-%d %H:%M:%S',
+                              time.localtime(budget['Exhaustion'])))
+
+        return budget
+
     def system_info(self):
         """Returns the UEM sys info page"""
         # Set base URL
@@ -330,7 +681,7 @@ class WSO():
 
     def find_og(self, name=None, pagesize=500, page=0):
         """Find ogs based on name"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
         # Set base URL
         url = '/api/system/groups/search'
 
@@ -341,7 +692,7 @@ class WSO():
 
     def get_og(self, group_id: int):
         """Abstract function of find_og()"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Set base URL
         url = '/api/system/groups/%i' % group_id
@@ -350,9 +701,54 @@ class WSO():
 
     def get_all_ogs(self, pagesize=500, page=0):
         """Abstract function of find_og()"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
         return self.find_og(pagesize=pagesize, page=page)
 
+    def iter_all_ogs(self, name=None, pagesize=500, stream=False):
+        """Generator of all OGs, yields one OG at a time,
+           stream decodes each page as it is downloaded"""
+        if stream:
+            return self.stream_pages('/api/system/groups/search',
+                                     "OrganizationGroups",
+                                     self.querystring(name=name), 2,
+                                     pagesize)
+
+        return self.iter_pages(self.find_og,
+                               "OrganizationGroups",
+                               pagesize,
+                               name=name)
+
+    def get_og_index(self):
+        """Returns the OG hierarchy index, it's loaded on first use and
+           reloaded once it's older than og_index_ttl seconds.
+           Returns None if it can't be loaded"""
+        if self.og_index is None:
+            self.og_index = OGIndex(ttl=self.og_index_ttl)
+
+        if self.og_index.expired() and self.refresh_og_index() is False:
+            return None
+
+        return self.og_index
+
+    def refresh_og_index(self):
+        """Reloads the OG hierarchy index from the API"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        if self.og_index is None:
+            self.og_index = OGIndex(ttl=self.og_index_ttl)
+
+        try:
+            ogs = list(self.iter_all_ogs(pagesize=self.bulk_pagesize))
+        except PagingError:
+            self.error("Unable to load the OG index")
+            return False
+
+        count = self.og_index.load(ogs)
+
+        self.info("OG index loaded %i OGs", count)
+
+        return count
+
     # MDM Queries
     def bulk_limits(self):
         """Returns the UEM sys info page"""
@@ -361,9 +757,20 @@ class WSO():
 
         return self.simple_get(url, version=1)
 
+    def get_bulk_limit(self, key):
+        """Gets a limit from bulk_limits(), loaded once per session.
+           Returns None if the console has no limit for the key"""
+        if self.bulk_settings is None:
+            self.bulk_settings = self.bulk_limits() or {}
+
+        if key is None or self.bulk_settings.get('EnableBulkLimits') is False:
+            return None
+
+        return self.bulk_settings.get(key)
+
     def device_counts(self, organizationgroupid=None):
         """Returns the UEM sys info page"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Set base URL
         url = '/api/mdm/devices/devicecountinfo'
@@ -375,7 +782,7 @@ class WSO():
 
     def get_group(self, group_id: int, pagesize=500, page=0):
         """Get a group from the ID"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
         # Set base URL
         url = '/api/mdm/smartgroups/%i' % group_id
 
@@ -384,9 +791,46 @@ class WSO():
 
         return self.simple_get(url, querystring, 1)
 
+    def get_group_all_devices(self, group_id: int, pagesize=500):
+        """Get a group with all of its DeviceAdditions, pages are
+           requested until a short page or one with no new devices in
+           case the console doesn't page them. Returns False on error"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        group = self.get_group(group_id, pagesize=pagesize, page=0)
+        if not group:
+            return False
+
+        additions = {}
+        page_additions = group.get('DeviceAdditions') or []
+        page = 0
+
+        while True:
+            new = [
+                device for device in page_additions
+                if device['Id'] not in additions
+            ]
+            for device in new:
+                additions[device['Id']] = device
+
+            if not new or len(page_additions) < pagesize:
+                break
+
+            page += 1
+            response = self.get_group(group_id, pagesize=pagesize, page=page)
+            if not response:
+                self.error('Unable to get page %i of group %s', page,
+                           group_id)
+                return False
+
+            page_additions = response.get('DeviceAdditions') or []
+
+        group['DeviceAdditions'] = list(additions.values())
+        return group
+
     def find_group(self, name=None, pagesize=500, page=0):
         """Find a group by name"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
         # Set base URL
         url = '/api/mdm/smartgroups/search'
 
@@ -395,9 +839,16 @@ class WSO():
 
         return self.simple_get(url, querystring, 1)
 
+    def iter_groups(self, name=None, pagesize=500):
+        """Generator of smart groups, yields one group at a time"""
+        return self.iter_pages(self.find_group,
+                               "SmartGroups",
+                               pagesize,
+                               name=name)
+
     def find_product(self, name, smartgroupid=None, pagesize=500, page=0):
         """Search for product by name"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
         # Set base URL
         url = '/api/mdm/products/search'
 
@@ -411,24 +862,36 @@ class WSO():
 
     def get_product(self, product_id: int):
         """Get product by ID"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Set base URL
         url = '/api/mdm/products/%i' % product_id
 
         return self.simple_get(url, version=1)
 
+    def product_snapshot(self, product_id: int, product=None):
+        """Returns product if it's set, otherwise gets it. Pass the
+           snapshot through product operations so each costs one read"""
+        if product is None:
+            product = self.get_product(product_id)
+
+            if product:
+                self.name_cache.set(("products", str(product_id)),
+                                    product['Name'])
+
+        return product
+
     def get_product_device_state(self,
                                  product_id: int,
                                  state: str,
                                  pagesize=500,
                                  page=0):
         """Search for product by name"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Check if state is valid
         if state not in ['compliant', 'inprogress', 'failed', 'assigned']:
-            self.error('Invalid state %s' % state)
+            self.error('Invalid state %s', state)
             return None
 
         # Set base URL
@@ -439,34 +902,55 @@ class WSO():
 
         return self.simple_get(url, querystring, 2)
 
-    def get_product_assigned_groups(self, product_id: int):
-        """Gets all assigned groups for a product id, uses get_product()"""
-        self.info("args: %s" % self.filter_locals(locals()))
-
-        product = self.get_product(product_id)
-
-        if product is not False:
+    def iter_product_device_state(self,
+                                  product_id: int,
+                                  state: str,
+                                  pagesize=500):
+        """Generator of devices in a product state, yields one at a time"""
+        return self.iter_pages(self.get_product_device_state,
+                               "Devices",
+                               pagesize,
+                               product_id=product_id,
+                               state=state)
+
+    def get_product_assigned_groups(self, product_id: int, product=None):
+        """Gets all assigned groups for a product id, uses get_product()
+           unless a product snapshot is given"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        product = self.product_snapshot(product_id, product)
+
+        if product:
             if product['SmartGroups'] == []:
-                self.debug('Product %s has no assigned groups' % product_id)
+                self.debug('Product %s has no assigned groups', product_id)
             return product['SmartGroups']
         else:
             return False
 
-    def product_is_active(self, product_id):
+    def product_is_active(self, product_id, product=None):
         """Checks if a product is active, returns Bool"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
-        product = self.get_product(product_id)
+        product = self.product_snapshot(product_id, product)
 
         self.info(product['Active'])
 
         return product['Active']
 
-    def xctivate_product(self, action: str, product_id: int, skip_check: bool):
-        """Activates or Deactivates a product based on ID, returns Bool"""
-        self.info("args: %s" % self.filter_locals(locals()))
+    def xctivate_product(self,
+                         action: str,
+                         product_id: int,
+                         skip_check: bool,
+                         product=None):
+        """Activates or Deactivates a product based on ID, returns Bool.
+           product is an optional snapshot from product_snapshot()"""
+        self.info("args: %s", LazyArgs(locals()))
 
-        product = self.get_product(product_id)
+        product = self.product_snapshot(product_id, product)
+
+        if not product:
+            self.error('Invalid product ID: %s', product_id)
+            return False
 
         # Get current state
         product_state = product['Active']
@@ -482,30 +966,31 @@ class WSO():
         if activation is not None:
             print("%s has an auto activation enabled for %s" %
                   (product["Name"], activation))
-            self.warning("%s has an auto activation enabled for %s" %
-                         (product["Name"], activation))
+            self.warning("%s has an auto activation enabled for %s",
+                         product["Name"], activation)
         if deactivation is not None:
             print("%s has an auto deactivation enabled for %s" %
                   (product["Name"], deactivation))
-            self.warning("%s has an auto deactivation enabled for %s" %
-                         (product["Name"], deactivation))
+            self.warning("%s has an auto deactivation enabled for %s",
+                         product["Name"], deactivation)
 
         # print(datetime.datetime.strptime(activation, '%-m/%-d/%Y %H:%M:%S tt'))
         # TODO: Find fix for decimal m & d on all systems
 
         # Check that there is at least 1 group assigned
         if not self.get_product_assigned_groups(
-                product_id) and skip_check is False and action == "activate":
+                product_id, product) and skip_check is False and \
+                action == "activate":
             self.error(
-                "There are no smart groups assigned to %s, unable to activate"
-                % product['Name'])
+                "There are no smart groups assigned to %s, unable to activate",
+                product['Name'])
             return False
 
         # Check if anything needs to be done
         if (product_state
                 and action == 'activate') or (not product_state
                                               and action == 'deactivate'):
-            self.warning('Product %s is already in the desired state' %
+            self.warning('Product %s is already in the desired state',
                          product["Name"])
             return True
 
@@ -515,47 +1000,63 @@ class WSO():
         response = self.rest_v1.post(url)
 
         if self.check_http_response(response):
-            self.info("%s has been %sd" % (product['Name'], action))
+            self.info("%s has been %sd", product['Name'], action)
+
+            # Keep the snapshot current for the caller
+            product['Active'] = action == 'activate'
         else:  # pragma: no cover
             # Shouln't reach this state however log it just in case
-            self.error("Unable to %s %s" % (action, product_id))
+            self.error("Unable to %s %s", action, product_id)
 
         return self.check_http_response(response)
 
-    def activate_product(self, product_id, skip_check=False):
+    def activate_product(self, product_id, skip_check=False, product=None):
         """Activates a product"""
-        print('Activating product %s' % self.get_product_name(product_id))
-        return self.xctivate_product('activate', product_id, skip_check)
+        product = self.product_snapshot(product_id, product)
+        if not product:
+            self.error('Invalid product ID: %s', product_id)
+            return False
+
+        print('Activating product %s' % product['Name'])
+        return self.xctivate_product('activate', product_id, skip_check,
+                                     product)
 
-    def deactivate_product(self, product_id, skip_check=True):
+    def deactivate_product(self, product_id, skip_check=True, product=None):
         """Deactivates a product"""
-        print('Dectivating product %s' % self.get_product_name(product_id))
-        return self.xctivate_product('deactivate', product_id, skip_check)
+        product = self.product_snapshot(product_id, product)
+        if not product:
+            self.error('Invalid product ID: %s', product_id)
+            return False
+
+        print('Dectivating product %s' % product['Name'])
+        return self.xctivate_product('deactivate', product_id, skip_check,
+                                     product)
 
     def delete_product(self, product_id):
         """Delete a product based on ID"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         product_name = self.get_product_name(product_id)
         if product_name is False:
-            self.error("Product %s doesn't exist" % product_id)
+            self.error("Product %s doesn't exist", product_id)
 
         if self.get_product_assigned_groups(product_id):
-            self.critical("Product %s has groups assigned, unable to delete" %
+            self.critical("Product %s has groups assigned, unable to delete",
                           product_id)
             return False
 
         else:
-            self.debug("Deleting product %s" % product_name)
+            self.debug("Deleting product %s", product_name)
             response = self.rest_v1.delete('/api/mdm/products/%i' % product_id)
-            self.info("Response body - %s" % response.text)
+            self.info("Response body - %s", response.text)
 
             if self.check_http_response(response):
-                self.info("Product %s deleted" % product_name)
+                self.invalidate_name("products", product_id)
+                self.info("Product %s deleted", product_name)
                 print("Product %s deleted" % product_name)
                 return True
             else:
-                self.error("Unable to delete %s" % product_name)
+                self.error("Unable to delete %s", product_name)
         return False
 
     def get_device(self,
@@ -566,9 +1067,11 @@ class WSO():
                    imei=None,
                    eas_id=None,
                    pagesize=500,
-                   page=0):
-        """Get devices from AirWatch"""
-        self.info("args: %s" % self.filter_locals(locals()))
+                   page=0,
+                   inventory_refresh=True):
+        """Get devices from AirWatch, inventory_refresh False skips
+           refreshing the inventory when the caller already has"""
+        self.info("args: %s", LazyArgs(locals()))
 
         # Set base URL
         url = '/api/mdm/devices'
@@ -593,13 +1096,210 @@ class WSO():
             self.error("No device search parameters speficied")
             return False
 
-        self.info("Searching by %s for %s" % (_id, ids[_id]))
+        if self.inventory is not None and page == 0:
+            if inventory_refresh:
+                self.update_inventory()
+
+            device = self.inventory.get(_id, ids[_id])
+            if device is not None:
+                self.info("Found %s %s in inventory", _id, ids[_id])
+                return device
+
+        self.info("Searching by %s for %s", _id, ids[_id])
         querystring = self.querystring(searchBy=_id,
                                        id=ids[_id],
                                        pagesize=pagesize,
                                        page=page)
 
-        return self.simple_get(url, querystring, 1)
+        response = self.simple_get(url, querystring, 1)
+
+        if self.inventory is not None and response:
+            self.inventory.add([response])
+
+        return response
+
+    def resolve_devices(self,
+                        serials=None,
+                        udids=None,
+                        macs=None,
+                        imeis=None,
+                        device_ids=None,
+                        eas_ids=None):
+        """Resolves a list of device identifiers of one type to devices.
+           Small lists are looked up concurrently, large lists are
+           matched against a scan of all devices. With the inventory
+           enabled only the values it's missing are queried. Returns a
+           dict of Devices (value => device), DeviceIds (value => device
+           ID) and Missing (values not found)"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        # Map ids against the WSO format and the get_device() args
+        ids = {}
+        ids["DeviceId"] = device_ids, "device_id"
+        ids["Macaddress"] = macs, "macaddress"
+        ids["Udid"] = udids, "udid"
+        ids["Serialnumber"] = serials, "serial_number"
+        ids["ImeiNumber"] = imeis, "imei"
+        ids["EasId"] = eas_ids, "eas_id"
+
+        id_type = None
+
+        for _query in ids:
+            if ids[_query][0] is not None:
+                id_type = _query
+                break
+
+        if id_type is None:
+            self.error("No device search parameters speficied")
+            return False
+
+        # Remove duplicates, keeping the order
+        values = list(dict.fromkeys(ids[id_type][0]))
+        arg = ids[id_type][1]
+
+        found = {}
+        remaining = values
+        full_refresh = False
+
+        # Use the inventory if it's enabled
+        if self.inventory is not None and id_type in DEVICE_INDEXES:
+            full = self.inventory.full_due()
+            refreshed = self.update_inventory()
+            full_refresh = full and refreshed is not None and \
+                refreshed is not False
+
+            for value in values:
+                device = self.inventory.get(id_type, value)
+                if device is not None:
+                    found[value] = device
+
+            remaining = [value for value in values if value not in found]
+
+        strategy = None
+        if remaining:
+            strategy = self.device_query_strategy(len(remaining), id_type)
+
+        # A full refresh just scanned every device, don't scan again
+        if strategy == "scan" and full_refresh:
+            self.debug("Not scanning for %i %s values missing from a full "
+                       "inventory refresh", len(remaining), id_type)
+            strategy = None
+
+        if strategy == "scan":
+            # The wanted values are matched as each page arrives
+            self.debug("Scanning all devices for %i %s values",
+                       len(remaining), id_type)
+
+            wanted = {}
+            for value in remaining:
+                wanted[DeviceInventory.normalise(id_type, value)] = value
+
+            try:
+                for device in self.iter_all_devices(
+                        pagesize=self.bulk_pagesize):
+                    value = DeviceInventory.device_value(device, id_type)
+                    if value in (None, ""):
+                        continue
+
+                    value = wanted.pop(
+                        DeviceInventory.normalise(id_type, value), None)
+                    if value is not None:
+                        found[value] = device
+            except PagingError:
+                # A partial scan would report devices as missing
+                self.error("Device scan failed, unable to resolve devices")
+                return False
+
+        elif strategy == "lookup":
+            self.debug("Looking up %i %s values", len(remaining), id_type)
+
+            def lookup(value):
+                return value, self.get_device(inventory_refresh=False,
+                                              **{arg: value})
+
+            for value, device in self.imap_concurrent(lookup, remaining):
+                if device:
+                    found[value] = device
+
+        result = {}
+        result['Devices'] = found
+        result['DeviceIds'] = {}
+        result['Missing'] = []
+
+        for value in values:
+            if value in found:
+                result['DeviceIds'][value] = found[value]['Id']['Value']
+            else:
+                self.warning('Device %s %s doesn\'t exist', id_type, value)
+                result['Missing'].append(value)
+
+        self.info("Resolved %i of %i %s values", len(found), len(values),
+                  id_type)
+
+        return result
+
+    def device_query_strategy(self, count, id_type="Serialnumber"):
+        """Decides between looking up count devices individually or
+           scanning all devices, returns lookup or scan"""
+        # EAS IDs aren't in the device search results
+        if id_type not in DEVICE_INDEXES:
+            return "lookup"
+
+        if self.bulk_query_trigger == "auto":
+            return self.estimate_device_query(count)
+
+        if count > self.bulk_query_trigger:
+            return "scan"
+
+        return "lookup"
+
+    def fleet_size(self):
+        """Returns the number of devices from device_counts(),
+           cached for an hour"""
+        if self.fleet is None or time.time() - self.fleet[0] > 3600:
+            counts = self.device_counts()
+            if not counts:
+                return None
+
+            self.fleet = (time.time(), counts['TotalDevices'])
+
+        return self.fleet[1]
+
+    def estimate_device_query(self, count):
+        """Cost model for the auto bulk_query_trigger, compares the time
+           to look up count devices concurrently with the time to page
+           through the whole fleet. Returns lookup or scan"""
+        fleet = self.fleet_size()
+        if fleet is None:
+            self.warning("Unable to get the fleet size, looking up devices")
+            return "lookup"
+
+        lookup_latency = self.measured_latency('/api/mdm/devices')
+        if lookup_latency is None:
+            lookup_latency = self.default_latency
+
+        page_latency = self.measured_latency('/api/mdm/devices/search',
+                                             self.bulk_pagesize)
+        if page_latency is None:
+            page_latency = lookup_latency + \
+                self.default_device_latency * min(fleet, self.bulk_pagesize)
+
+        # Lookups all run concurrently, the scan gets the first page
+        # before the rest run concurrently
+        pages = max(-(-fleet // self.bulk_pagesize), 1)
+        lookup_time = lookup_latency * -(-count // self.max_workers)
+        scan_time = page_latency * (1 + -(-(pages - 1) // self.max_workers))
+
+        strategy = "lookup"
+        if scan_time < lookup_time:
+            strategy = "scan"
+
+        self.info(
+            "Device query for %i of %i devices: lookup %i calls %.2fs, "
+            "scan %i calls %.2fs, using %s", count, fleet, count, lookup_time,
+            pages, scan_time, strategy)
+
+        return strategy
 
     def get_all_devices(self,
                         user=None,
@@ -615,7 +1315,7 @@ class WSO():
                         pagesize=500,
                         page=0):
         """Get all devices from AirWatch"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Set base URL
         url = '/api/mdm/devices/search'
@@ -635,9 +1335,159 @@ class WSO():
 
         return self.simple_get(url, querystring, 1)
 
+    def iter_all_devices(self, pagesize=500, stream=False, **filters):
+        """Generator of all devices, walks the pages of get_all_devices()
+           and yields one device at a time. Accepts the same filters,
+           stream decodes each page as it is downloaded to save memory"""
+        if stream:
+            return self.stream_pages('/api/mdm/devices/search', "Devices",
+                                     self.querystring(**filters), 1,
+                                     pagesize)
+
+        return self.iter_pages(self.get_all_devices, "Devices", pagesize,
+                               **filters)
+
+    def export_devices(self,
+                       path,
+                       fields=None,
+                       file_format=None,
+                       pagesize=None,
+                       **filters):
+        """Streams all devices to a CSV, JSON Lines, Parquet or Arrow file.
+           Fields are dotted for nested values e.g. ModelId.Name, the
+           format is taken from the extension if not set. Accepts the
+           get_all_devices() filters, returns the number of devices"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        if fields is None:
+            fields = export.DEVICE_FIELDS
+
+        if file_format is None:
+            file_format = export.export_format(path)
+
+        if file_format not in export.EXPORT_FORMATS:
+            self.error("Unsupported export format %s, use one of %s",
+                       file_format, ", ".join(export.EXPORT_FORMATS))
+            return False
+
+        if pagesize is None:
+            pagesize = self.bulk_pagesize
+
+        devices = self.iter_all_devices(pagesize=pagesize,
+                                        stream=True,
+                                        **filters)
+
+        try:
+            if file_format == "csv":
+                count = export.write_csv(devices, fields, path)
+            elif file_format == "jsonl":
+                count = export.write_jsonl(devices, fields, path)
+            else:
+                count = export.write_arrow(devices, fields, path,
+                                           file_format)
+        except PagingError:
+            # Don't leave a partial export that looks complete
+            self.error("Export to %s failed, removing it", path)
+            if os.path.exists(path):
+                os.remove(path)
+            return False
+
+        self.info("Exported %i devices to %s", count, path)
+
+        return count
+
+    def enable_inventory(self, ttl=3600, path=None, warm=True,
+                         full_ttl=86400):
+        """Turns on the local device inventory used to resolve devices.
+           It's refreshed every ttl seconds and fully reloaded every
+           full_ttl seconds, path persists it to a file"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        self.inventory = DeviceInventory(ttl=ttl, path=path,
+                                         full_ttl=full_ttl)
+
+        if warm:
+            self.refresh_inventory()
+
+        return self.inventory
+
+    def inventory_due(self):
+        """Checks if the inventory needs a refresh and isn't backing off
+           after a failed refresh"""
+        if not self.inventory.expired():
+            return False
+
+        return self.inventory_failed is None or \
+            time.time() - self.inventory_failed > self.inventory_retry
+
+    def update_inventory(self):
+        """Refreshes the inventory if it's due, concurrent callers wait
+           for one refresh instead of starting their own. Returns the
+           refresh_inventory() result or None if no refresh was needed"""
+        if not self.inventory_due():
+            return None
+
+        with self.inventory_lock:
+            # Another thread may have refreshed while waiting
+            if not self.inventory_due():
+                return None
+
+            return self.refresh_inventory()
+
+    def refresh_inventory(self, full=False):
+        """Updates the inventory from the API, only devices seen since
+           the last refresh are fetched unless full is True or a full
+           refresh is due. A full refresh drops the devices it didn't
+           return"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        if self.inventory is None:
+            self.error("Inventory is not enabled")
+            return False
+
+        started = time.time()
+        seensince = None
+        full = full or self.inventory.full_due()
+
+        if not full and self.inventory.last_refresh is not None:
+            # UTC, overlapping the last refresh to allow for clock skew
+            seensince = time.strftime(
+                '%Y-%m-%dT%H:%M:%S',
+                time.gmtime(self.inventory.last_refresh - 300))
+
+        self.debug("Refreshing inventory, seen since %s", seensince)
+        try:
+            count = self.inventory.add(
+                self.iter_all_devices(pagesize=self.bulk_pagesize,
+                                      seensince=seensince))
+        except PagingError:
+            # Leave the last refresh so the missed devices are fetched again
+            self.error("Inventory refresh failed, retrying in %is",
+                       self.inventory_retry)
+            self.inventory_failed = time.time()
+            return False
+
+        self.inventory_failed = None
+
+        if full:
+            # Devices that weren't returned have been deleted
+            self.inventory.prune(started)
+            self.inventory.last_full_refresh = started
+        else:
+            # Devices that weren't returned haven't changed
+            self.inventory.touch(started)
+
+        self.inventory.last_refresh = started
+        self.inventory.save()
+
+        self.info("Inventory refreshed %i devices, %i total", count,
+                  len(self.inventory))
+
+        return count
+
     def get_device_ip(self, serial_number=None, device_id=None):
         """Get device IP from serial"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         if serial_number is None and device_id is None:
             self.error("No device search criteria specified")
@@ -648,7 +1498,7 @@ class WSO():
             self.info("Resolving device ID to serial")
             device = self.get_device(device_id=device_id)
             if device:
-                self.debug("%s => %s" % (device_id, device["SerialNumber"]))
+                self.debug("%s => %s", device_id, device["SerialNumber"])
                 serial_number = device["SerialNumber"]
 
         response = self.simple_get(
@@ -676,7 +1526,7 @@ class WSO():
                              page=None,
                              pagesize=None):
         """Get device using a varity of parameters"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         url = "/api/mdm/devices/extensivesearch"
 
@@ -703,7 +1553,7 @@ class WSO():
             self.error("No device search parameters speficied")
             return False
 
-        self.info("Searching by %s for %s" % (_id, ids[_id]))
+        self.info("Searching by %s for %s", _id, ids[_id])
 
         querystring = self.querystring(
             DeviceId=device_id,
@@ -721,49 +1571,60 @@ class WSO():
 
         return self.simple_get(url, querystring, 1)
 
-    def assign_group_to_product(self, product_id: int, group_id: int):
-        """Assigns a group to a product"""
-        self.info("args: %s" % self.filter_locals(locals()))
+    def assign_group_to_product(self,
+                                product_id: int,
+                                group_id: int,
+                                product=None):
+        """Assigns a group to a product, product is an optional snapshot
+           from product_snapshot() which is updated with the group"""
+        self.info("args: %s", LazyArgs(locals()))
         # Get product current assignments
         # Check group is not already assigned
         # Assign group
 
         # Check group and product are valid
         group_name = self.get_group_name(group_id)
-        product_name = self.get_product_name(product_id)
+        product = self.product_snapshot(product_id, product)
+        product_name = product['Name'] if product else False
         print('Assigning group %s to product %s' % (group_id, product_name))
 
         if not group_name:
-            self.error('Invalid group ID: %i' % group_id)
+            self.error('Invalid group ID: %i', group_id)
             return False
 
         if not product_name:
-            self.error('Invalid product ID: %i' % product_id)
+            self.error('Invalid product ID: %i', product_id)
             return False
 
-        assigned_groups = self.get_product_assigned_groups(product_id)
+        assigned_groups = self.get_product_assigned_groups(product_id, product)
 
         # Check if group is already assigned
         for group in assigned_groups:
             if group['SmartGroupId'] == group_id:
-                self.warning('Smart group %s already assigned to %s' %
-                             (product_id, group_id))
+                self.warning('Smart group %s already assigned to %s',
+                             product_id, group_id)
                 return True
 
-        self.debug('Assigning %s to %s' % (group_name, product_name))
+        self.debug('Assigning %s to %s', group_name, product_name)
         response = self.rest_v1.post('/api/mdm/products/%s/addsmartgroup/%s' %
                                      (product_id, group_id))
 
+        if self.check_http_response(response):
+            # Keep the snapshot current for the caller
+            group = {}
+            group['SmartGroupId'] = group_id
+            group['Name'] = group_name
+            product['SmartGroups'].append(group)
+
         if self.check_http_response(response) and self.product_is_active(
-                product_id):
-            self.debug('Reprocessing product %s' % product_name)
+                product_id, product):
+            self.debug('Reprocessing product %s', product_name)
             reprocess = self.reprocess_product(product_id=product_id,
                                                device_list=None,
                                                force=False)
 
             if reprocess:
-                self.debug('Product %s reprocessed successfully' %
-                           product_name)
+                self.debug('Product %s reprocessed successfully', product_name)
             return reprocess
 
         # Encountered issue where groups would be assigned but the product not assigned
@@ -776,61 +1637,209 @@ class WSO():
 
         return self.check_http_response(response)
 
+    def add_group_to_product(self, product_id, group_id):
+        """Adds a group to a product without the checks or reprocessing
+           done by assign_group_to_product()"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        response = self.rest_v1.post('/api/mdm/products/%s/addsmartgroup/%s' %
+                                     (product_id, group_id))
+
+        if self.check_http_response(response):
+            self.info("%s added to %s", group_id, product_id)
+            return True
+
+        self.error("Unable to add %s to %s", group_id, product_id)
+        return False
+
+    def rollout_product(self, product_id, group_ids, activate=True,
+                        remove=True):
+        """Brings a product's group assignments in line with group_ids,
+           groups not in the list are removed unless remove is False.
+           Only the changes are applied and an active product is
+           reprocessed once. Returns a dict of the outcome"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        outcome = {}
+        outcome['Added'] = []
+        outcome['Removed'] = []
+        outcome['Activated'] = False
+        outcome['Reprocessed'] = False
+        outcome['Success'] = False
+
+        product = self.product_snapshot(product_id)
+        if not product:
+            self.error('Invalid product ID: %s', product_id)
+            return outcome
+
+        was_active = product['Active']
+        success = True
+
+        # Diff the desired groups against the current assignments
+        desired = list(dict.fromkeys(group_ids))
+        current = [group['SmartGroupId'] for group in product['SmartGroups']]
+
+        for group_id in desired:
+            if group_id in current:
+                continue
+
+            if self.add_group_to_product(product_id, group_id):
+                outcome['Added'].append(group_id)
+            else:
+                success = False
+
+        if remove:
+            for group in product['SmartGroups']:
+                if group['SmartGroupId'] in desired:
+                    continue
+
+                if self.remove_group_from_product(product_id,
+                                                  group['SmartGroupId'],
+                                                  group['Name'],
+                                                  product['Name']):
+                    outcome['Removed'].append(group['SmartGroupId'])
+                else:
+                    success = False
+
+        # Keep the snapshot current for the activation check
+        product['SmartGroups'] = [
+            group for group in product['SmartGroups']
+            if group['SmartGroupId'] not in outcome['Removed']
+        ]
+        for group_id in outcome['Added']:
+            group = {}
+            group['SmartGroupId'] = group_id
+            product['SmartGroups'].append(group)
+
+        if activate and not was_active:
+            outcome['Activated'] = self.xctivate_product(
+                'activate', product_id, False, product)
+            success = success and outcome['Activated']
+
+        # Activating pushes the product, an active product needs
+        # reprocessing to queue the changes
+        elif was_active and (outcome['Added'] or outcome['Removed']):
+            outcome['Reprocessed'] = self.reprocess_product(product_id,
+                                                            None,
+                                                            force=False)
+            success = success and outcome['Reprocessed']
+
+        outcome['Success'] = success
+
+        return outcome
+
+    def rollout_products(self, rollouts, activate=True, remove=True):
+        """Runs rollout_product() for many products concurrently, the
+           shared rate limiter keeps the requests within the API budget.
+           rollouts is a list of (product ID, [group IDs]) pairs or a dict.
+           Returns a dict of product ID => outcome, or False if a product
+           is listed more than once"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        if isinstance(rollouts, dict):
+            rollouts = rollouts.items()
+        rollouts = list(rollouts)
+
+        # Concurrent rollouts of one product would work from stale
+        # snapshots, and it's unclear which group list is wanted
+        counts = Counter(pair[0] for pair in rollouts)
+        duplicates = [
+            product_id for product_id, count in counts.items() if count > 1
+        ]
+        if duplicates:
+            self.error("Products %s are listed more than once", duplicates)
+            return False
+
+        def rollout(pair):
+            return pair[0], self.rollout_product(pair[0], pair[1], activate,
+                                                 remove)
+
+        outcomes = {}
+        for product_id, outcome in self.imap_concurrent(rollout, rollouts):
+            outcomes[product_id] = outcome
+
+        failed = [
+            product_id for product_id, outcome in outcomes.items()
+            if not outcome['Success']
+        ]
+        if failed:
+            self.error("Rollout failed for products %s", failed)
+
+        self.info("Rolled out %i products, %i failed", len(outcomes),
+                  len(failed))
+
+        return outcomes
+
     def check_no_group_assignments(self, product_id):
         """Checks if product has no assignemnts"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         if self.get_product_assigned_groups(product_id) == []:
             return True
         return False
 
-    def remove_group_from_product(self, product_id, group_id):
-        """Removes the specified group from a product"""
-        self.info("args: %s" % self.filter_locals(locals()))
-
-        self.info(
-            "Removing group %s from %s" %
-            (self.get_group_name(group_id), self.get_product_name(product_id)))
+    def remove_group_from_product(self,
+                                  product_id,
+                                  group_id,
+                                  group_name=None,
+                                  product_name=None):
+        """Removes the specified group from a product, the names are only
+           used for logging and are resolved if they aren't given"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        # Resolving the names costs API calls, only do it if they're logged
+        if self.log_enabled(logging.INFO):
+            if group_name is None:
+                group_name = self.get_group_name(group_id)
+            if product_name is None:
+                product_name = self.get_product_name(product_id)
+            self.info("Removing group %s from %s", group_name, product_name)
         response = self.rest_v1.post(
             '/api/mdm/products/%s/removesmartgroup/%s' %
             (product_id, group_id))
 
         # Check response
         if self.check_http_response(response):
-            self.info("%i removed from %i" % (group_id, product_id))
+            self.info("%i removed from %i", group_id, product_id)
             return True
         else:  # pragma: no cover
             # Shouln't reach this state however log it just in case
-            self.error("Unable to remove %i from %i" % (group_id, product_id))
+            self.error("Unable to remove %i from %i", group_id, product_id)
 
         return False
 
     def remove_all_groups_from_product(self, product_id):
-        """Remove all assigned groups from products"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        """Remove all assigned groups from products, the groups are
+           removed concurrently"""
+        self.info("args: %s", LazyArgs(locals()))
 
-        product_name = self.get_product_name(product_id)
+        # One read gives the name and the assigned groups
+        product = self.product_snapshot(product_id)
 
-        if not product_name:
-            self.error('Invalid product ID %s' % product_id)
+        if not product:
+            self.error('Invalid product ID %s', product_id)
             return False
 
-        assigned_groups = self.get_product_assigned_groups(product_id)
+        product_name = product['Name']
+        assigned_groups = product['SmartGroups']
 
         if assigned_groups == []:
             self.warning('Product has no assigned groups, nothing to do')
             return True
 
-        for group in assigned_groups:
-            self.debug('Removing %s:%s from %s' %
-                       (group['SmartGroupId'], group['Name'], product_name))
-            response = self.remove_group_from_product(product_id,
-                                                      group['SmartGroupId'])
+        def remove(group):
+            self.debug('Removing %s:%s from %s', group['SmartGroupId'],
+                       group['Name'], product_name)
+            return group, self.remove_group_from_product(
+                product_id, group['SmartGroupId'], group['Name'],
+                product_name)
+
+        for group, response in self.imap_concurrent(remove, assigned_groups):
             if response:
-                self.debug(
-                    '%s:%s removed from %s successfully' %
-                    (group['SmartGroupId'], group['Name'], product_name))
+                self.debug('%s:%s removed from %s successfully',
+                           group['SmartGroupId'], group['Name'], product_name)
 
+        # Verify with a single read
         if self.get_product_assigned_groups(product_id) == []:
             return True
 
@@ -839,52 +1848,156 @@ class WSO():
 
     def create_group(self, name, payload):
         """Create a group from a payload"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # TODO Add check for blank payload / check group size post creation
 
         # Check group doesn't already exist
         if self.find_group(name) is not None:
-            self.error('Group %s already exists' % name)
+            self.error('Group %s already exists', name)
             return False
 
         response = self.rest_v1.post('/api/mdm/smartgroups/', json=payload)
 
         if self.check_http_response(response):
-            print('Group %s created successfully, id: %s' %
-                  (name, self.str_to_json(response.text)['Value']))
-            return self.str_to_json(response.text)['Value']
+            group_id = self.str_to_json(response.text)['Value']
+            self.invalidate_name("smartgroups", group_id, name)
+            print('Group %s created successfully, id: %s' % (name, group_id))
+            return group_id
         else:  # pragma: no cover
-            self.error('Error creating group %s' % name)
+            self.error('Error creating group %s', name)
             return False
 
-    def create_group_from_devices(self, name, device_list):
+    def create_group_from_devices(self, name, device_list, device_index=None):
         """Create a group from a list of devices"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Format the list into the UEM payload
-        payload = self.format_group_payload_devices(name, device_list)
+        payload = self.format_group_payload_devices(name, device_list,
+                                                    device_index)
 
         if payload:
             return self.create_group(name, payload)
 
         return False
 
-    def create_group_from_ogs(self, name, og_list):
+    def sync_group_devices(self,
+                           group_id: int,
+                           desired_serials: list,
+                           remove_missing=False,
+                           pagesize=500):
+        """Brings the device additions of a group in line with a list of
+           serials instead of recreating it. The group is only updated
+           if devices need adding or removing. Devices aren't removed
+           while serials are missing unless remove_missing is True.
+           Returns a dict of Added and Removed device IDs, Missing
+           serials and Updated"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        # The update replaces the membership, so every page is needed
+        group = self.get_group_all_devices(group_id, pagesize)
+        if not group:
+            self.error('Invalid group ID: %s', group_id)
+            return False
+
+        resolved = self.resolve_devices(serials=list(desired_serials))
+        if resolved is False:
+            return False
+
+        # Failed lookups would otherwise empty the group
+        if resolved['Missing'] and not resolved['Devices']:
+            self.error('None of the %i serials were found, not updating '
+                       'group %s', len(resolved['Missing']), group_id)
+            return False
+
+        current = {}
+        for device in group.get('DeviceAdditions') or []:
+            current[device['Id']] = device
+
+        desired = {}
+        for device in resolved['Devices'].values():
+            desired[device['Id']['Value']] = device
+
+        report = {}
+        report['Added'] = [
+            dev_id for dev_id in desired if dev_id not in current
+        ]
+        report['Removed'] = [
+            dev_id for dev_id in current if dev_id not in desired
+        ]
+        report['Missing'] = resolved['Missing']
+        report['Updated'] = False
+
+        # A missing serial may be a device already in the group
+        if report['Missing'] and not remove_missing and report['Removed']:
+            self.warning('%i serials are missing, not removing %i devices '
+                         'from group %s', len(report['Missing']),
+                         len(report['Removed']), group_id)
+            report['Removed'] = []
+
+        if not report['Added'] and not report['Removed']:
+            self.info('Group %s is already in sync', group_id)
+            return report
+
+        self.debug('Adding %i and removing %i devices from group %s',
+                   len(report['Added']), len(report['Removed']), group_id)
+
+        # The API replaces the membership so the full list is sent
+        additions = [
+            current[dev_id] for dev_id in current
+            if dev_id not in report['Removed']
+        ]
+        for dev_id in report['Added']:
+            device = {}
+            device['Id'] = dev_id
+            device['Name'] = desired[dev_id]['DeviceFriendlyName']
+            additions.append(device)
+
+        payload = dict(group)
+        payload['DeviceAdditions'] = additions
+
+        response = self.rest_v1.put('/api/mdm/smartgroups/%i' % group_id,
+                                    json.dumps(payload))
+
+        if self.check_http_response(response):
+            report['Updated'] = True
+        else:
+            self.error('Error updating group %s', group_id)
+            return False
+
+        return report
+
+    def create_group_from_ogs(self, name, og_list, og_index=None):
         """Create a group from a list of OGs"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Format the list into the UEM payload
-        payload = self.format_group_payload_ogs(name, og_list)
+        payload = self.format_group_payload_ogs(name, og_list, og_index)
 
         if payload:
             return self.create_group(name, payload)
 
         return False
 
-    def format_group_payload_devices(self, group_name, serial_list):
-        """Create a group from a list of serials"""
-        self.info("args: %s" % self.filter_locals(locals()))
+    def index_devices(self, devices, key="SerialNumber"):
+        """Builds a dict of device key => device from a list of devices,
+           can be passed to format_group_payload_devices() to reuse"""
+        self.info("Generating device index on %s", key)
+
+        index = {}
+        for device in devices:
+            if device.get(key) is not None:
+                index[str(device[key])] = device
+
+        return index
+
+    def format_group_payload_devices(self,
+                                     group_name,
+                                     serial_list,
+                                     device_index=None):
+        """Create a group from a list of serials, device_index is an optional
+           serial index from index_devices() to use instead of the API"""
+        self.info("args: %s", LazyArgs(locals()))
 
         payload = {}
         payload['Name'] = group_name
@@ -894,62 +2007,94 @@ class WSO():
         # Remove duplicates in list
         serial_list = list(set(serial_list))
 
-        # Check if list is large enough for bulk limits
-        if len(serial_list) > self.bulk_query_trigger:
-            # Bulk query mode
-            self.debug("Device list %s qualifies for bulk query" %
-                       len(serial_list))
-            self.debug("Getting all devices")
-
-            devices = self.get_all_devices(pagesize=999999)
-
-            # Generate two lists
-            # One for serials
-            # and one with serial as key for device ID
-            self.info("Generating bulk serial list")
-            console_serials = []
-            console_ids = {}
-            for device in devices["Devices"]:
-                console_serials.append(device["SerialNumber"])
-                console_ids[device["SerialNumber"]] = device["Id"]["Value"]
-
-            # Check through the submitted device list
+        if device_index is None:
+            # Lookup or scan depending on the list size
+            resolved = self.resolve_devices(serials=serial_list)
+            if resolved is False:
+                return False
+            devices = resolved['Devices']
+        else:
+            devices = {}
             for serial in serial_list:
-                if str(serial) in console_serials:
-                    self.info('Device %s is valid' % serial)
+                device_response = device_index.get(str(serial))
+                if device_response is not None:
+                    devices[serial] = device_response
                 else:
-                    self.warning('Device %s doesn\'t exist' % serial)
-                    continue
+                    self.warning('Device %s doesn\'t exist', serial)
 
-                device = {}
-                device['Id'] = console_ids[str(serial)]
-                payload['DeviceAdditions'].append(device)
+        # Check through the submitted device list
+        for serial in serial_list:
+            if serial not in devices:
+                continue
 
-        else:
-            # Small mode, query each device individually
-            for serial in serial_list:
-                device_response = self.get_device(serial_number=serial)
-                if device_response is not False:
-                    self.info('Device %s is valid' % serial)
-                elif device_response is False:
-                    self.warning('Device %s doesn\'t exist' % serial)
-                    continue
+            self.info('Device %s is valid', serial)
 
-                device = {}
-                device['Id'] = device_response['Id']['Value']
-                device['Name'] = device_response['DeviceFriendlyName']
-                payload['DeviceAdditions'].append(device)
+            device = {}
+            device['Id'] = devices[serial]['Id']['Value']
+            device['Name'] = devices[serial]['DeviceFriendlyName']
+            payload['DeviceAdditions'].append(device)
 
         if payload['DeviceAdditions'] == []:
-            self.error('No devices added to group %s' % group_name)
+            self.error('No devices added to group %s', group_name)
             return False
 
         return payload
 
-    def format_group_payload_ogs(self, group_name, og_list):
-        """Take a list of OGs and format it for a group POST req"""
-        # TODO add bulk limit
-        self.info("args: %s" % self.filter_locals(locals()))
+    def index_ogs(self, ogs, key="Name"):
+        """Builds a dict of OG key => OG from a list of OGs, can be passed
+           to format_group_payload_ogs() to reuse"""
+        self.info("Generating OG index on %s", key)
+
+        index = {}
+        for org_group in ogs:
+            if org_group.get(key) is not None:
+                index[str(org_group[key])] = org_group
+
+        return index
+
+    def resolve_ogs(self, og_list, og_index=None):
+        """Resolves OG names to OGs, looked up concurrently unless an
+           og_index from index_ogs() is given. Names must match exactly.
+           Returns a dict of name => OG, OGs that don't exist are left
+           out"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        # Use the OG index if it's been loaded
+        if og_index is None and self.og_index is not None and \
+                self.get_og_index() is not None:
+            og_index = self.og_index.index("Name")
+
+        if og_index is not None:
+            found = {}
+            for name in og_list:
+                if str(name) in og_index:
+                    found[name] = og_index[str(name)]
+            return found
+
+        def lookup(name):
+            response = self.find_og(name=name)
+            if not response:
+                return name, None
+
+            # The search also matches partial names, only use an exact
+            # match, the same as the index
+            for org_group in response["OrganizationGroups"]:
+                if org_group["Name"] == str(name):
+                    return name, org_group
+
+            return name, None
+
+        found = {}
+        for name, org_group in self.imap_concurrent(lookup, og_list):
+            if org_group is not None:
+                found[name] = org_group
+
+        return found
+
+    def format_group_payload_ogs(self, group_name, og_list, og_index=None):
+        """Take a list of OGs and format it for a group POST req,
+           og_index is an optional name index from index_ogs()"""
+        self.info("args: %s", LazyArgs(locals()))
 
         payload = {}
         payload['Name'] = group_name
@@ -959,45 +2104,46 @@ class WSO():
         # Remove duplicates in list
         og_list = list(set(og_list))
 
-        for org_group in og_list:
-            og_response = self.find_og(name=org_group)
+        ogs = self.resolve_ogs(og_list, og_index)
 
-            if og_response["OrganizationGroups"] == []:
-                self.warning("OG %s doesn\'t exist" % org_group)
+        for org_group in og_list:
+            if org_group not in ogs:
+                self.warning("OG %s doesn\'t exist", org_group)
                 continue
             else:
-                self.info('OG %s is valid' % org_group)
+                self.info('OG %s is valid', org_group)
 
             og_payload = {}
-            og_payload['Id'] = og_response['OrganizationGroups'][0]['Id']
-            og_payload['Name'] = og_response['OrganizationGroups'][0]['Name']
-            og_payload['Uuid'] = og_response['OrganizationGroups'][0]['Uuid']
+            og_payload['Id'] = ogs[org_group]['Id']
+            og_payload['Name'] = ogs[org_group]['Name']
+            og_payload['Uuid'] = ogs[org_group]['Uuid']
             payload['OrganizationGroups'].append(og_payload)
 
         if payload['OrganizationGroups'] == []:
-            self.error("No OGs added to group %s" % group_name)
+            self.error("No OGs added to group %s", group_name)
             return False
 
         return payload
 
     def delete_group(self, group_id):
         """Delete a group based on ID"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         group_name = self.get_group_name(group_id)
         if group_name is None:
-            self.error("Group %s doesn't exist" % group_id)
+            self.error("Group %s doesn't exist", group_id)
         else:
-            self.debug("Deleting group %s" % group_name)
+            self.debug("Deleting group %s", group_name)
             response = self.rest_v1.delete('/api/mdm/smartgroups/%i' %
                                            group_id)
             self.info(response.text)
 
             if self.check_http_response(response):
-                self.debug("Group %s deleted" % group_name)
+                self.invalidate_name("smartgroups", group_id)
+                self.debug("Group %s deleted", group_name)
                 return True
             else:
-                self.error("Unable to delete %s" % group_name)
+                self.error("Unable to delete %s", group_name)
         return False
 
     def get_all_tags(self, org_group=None, pagesize=500, page=0):
@@ -1009,7 +2155,7 @@ class WSO():
 
     def find_tag(self, name=None, org_group=None, pagesize=500, page=0):
         """Gets tags, supports all or searching, returns json"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         if org_group is None:
             # Set the product to be at the highest OG
@@ -1029,35 +2175,49 @@ class WSO():
 
         return False  # pragma: no cover
 
-    def add_tag(self, tag_id: int, devices: list):
-        """Adds tags to device list, returns bool"""
-        return self.x_tag('add', tag_id, devices)
+    def iter_tags(self, name=None, org_group=None, pagesize=500):
+        """Generator of tags, yields one tag at a time"""
+        if org_group is None:
+            # Resolve the highest OG once rather than once per page
+            org_group = self.find_og(pagesize=1)['OrganizationGroups'][0]['Id']
+
+        return self.iter_pages(self.find_tag,
+                               None,
+                               pagesize,
+                               name=name,
+                               org_group=org_group)
+
+    def add_tag(self, tag_id: int, devices: list, report=False):
+        """Adds tags to device list, returns bool or a report"""
+        return self.x_tag('add', tag_id, devices, report)
 
-    def remove_tag(self, tag_id: int, devices: list):
-        """Removes tags from device list, returns bool"""
-        return self.x_tag('remove', tag_id, devices)
+    def remove_tag(self, tag_id: int, devices: list, report=False):
+        """Removes tags from device list, returns bool or a report"""
+        return self.x_tag('remove', tag_id, devices, report)
 
-    def x_tag(self, action, tag_id: int, devices: list):
-        """Performs an action on device tags"""
-        self.info("args: %s" % self.filter_locals(locals()))
+    def x_tag(self, action, tag_id: int, devices: list, report=False):
+        """Performs an action on device tags, the devices are sent in
+           concurrent chunks. Returns True if every chunk was sent or
+           the per device report if report is True"""
+        self.info("args: %s", LazyArgs(locals()))
 
         if action not in ['add', 'remove']:
-            self.error('%s invalid action')
+            self.error('%s invalid action', action)
             return False
 
-        payload = {}
-        payload['BulkValues'] = {}
-        payload['BulkValues']['Value'] = devices
+        # The console has no bulk limit for tags, use the default size
+        tag_report = self.run_bulk('/api/mdm/tags/%i/%sdevices' %
+                                   (tag_id, action), devices,
+                                   self.bulk_chunk_size)
 
-        response = self.rest_v1.post('/api/mdm/tags/%i/%sdevices' %
-                                     (tag_id, action),
-                                     json=payload)
+        if report:
+            return tag_report
 
-        return self.check_http_response(response)
+        return tag_report['FailedChunks'] == 0
 
     def get_tagged_devices(self, tag_id: int):
         """Get all devices tagged with tag provided"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         response = self.simple_get('/api/mdm/tags/%i/devices' % tag_id)
 
@@ -1068,11 +2228,11 @@ class WSO():
 
     def create_tag(self, tagname: str, org_group=None, tagtype=1):
         """Create a tag"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         existing_tag = self.find_tag(name=tagname)
         if existing_tag:
-            self.warning('Tag already exists: %s' %
+            self.warning('Tag already exists: %s',
                          existing_tag[0]['Id']['Value'])
             return existing_tag[0]['Id']['Value']
 
@@ -1095,7 +2255,7 @@ class WSO():
 
     def delete_tag(self, tagid: int):
         """Delete a tag"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         response = self.rest_v1.delete('/api/mdm/tags/%i' % tagid)
         return self.check_http_response(response)
@@ -1103,7 +2263,7 @@ class WSO():
     def get_printer(self, printerid: int):  # pragma: no cover
         """Get a printer by ID"""
         # There are no printers available for testing against
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         return self.simple_get('/api/mdm/peripherals/printer/%i' % printerid)
 
@@ -1114,7 +2274,7 @@ class WSO():
                 serial_number=None,
                 imei=None):
         """Move device in another OG"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Map ids against the WSO format
         ids = {}
@@ -1134,7 +2294,7 @@ class WSO():
             self.error("No device search parameters speficied")
             return False
 
-        self.info("Searching by %s for %s" % (_id, ids[_id]))
+        self.info("Searching by %s for %s", _id, ids[_id])
         querystring = self.querystring(searchBy=_id, id=ids[_id], ogid=og_id)
 
         response = self.rest_v1.post(
@@ -1168,11 +2328,11 @@ class WSO():
             payload["LocationGroupType"] = location_group_type
 
         if not self.utils.check_timezone(timezone):
-            self.error("Invalid timezone %s for %s" % (name, timezone))
+            self.error("Invalid timezone %s for %s", name, timezone)
             return False
 
         if not self.utils.check_locale(locale):
-            self.error("Invalid locale %s for %s" % (name, locale))
+            self.error("Invalid locale %s for %s", name, locale)
             return False
 
         payload["Name"] = name
@@ -1206,57 +2366,248 @@ class WSO():
         # to increase performance you can disable this
         if strict_name and self.find_og(
                 name=payload["Name"])["OrganizationGroups"]:
-            self.error("OG %s already exists, unable to create" %
+            self.error("OG %s already exists, unable to create",
                        payload["Name"])
             return False
 
         if strict_group_id:
             if payload["GroupId"] != "":
-                ogs = self.get_all_ogs(pagesize=99999)['OrganizationGroups']
-                for og in ogs:
-                    if payload["GroupId"] == og['GroupId']:
-                        self.error(
-                            "OG with groupId %s already exists, unable to create"
-                            % payload["Name"])
-                        return False
+                # Check the cached OG index rather than loading every OG
+                og_index = self.get_og_index()
+                if og_index is None:
+                    self.error("Unable to check groupId %s is unique",
+                               payload["GroupId"])
+                    return False
+
+                if og_index.get("GroupId", payload["GroupId"]):
+                    self.error(
+                        "OG with groupId %s already exists, unable to create",
+                        payload["GroupId"])
+                    return False
 
         response = self.rest_v2.post("/api/system/groups/%i" % parentog_id,
                                      json=payload)
 
         if self.check_http_response(response):
-            return self.str_to_json(response.text)
+            created = self.str_to_json(response.text)
+
+            # Add the new OG so the index stays current
+            if self.og_index is not None and created:
+                org_group = dict(payload)
+                org_group['Id'] = created.get('Id')
+                org_group['Uuid'] = created.get('Uuid')
+                org_group['ParentLocationGroup'] = {'Id': parentog_id}
+                self.og_index.add([org_group])
+
+            return created
 
         return False
 
+    def provision_ogs(self, og_tree, parentog_id: int, strict_name=False):
+        """Creates a tree of OGs, each level is created concurrently once
+           its parents exist. og_tree is a list of payloads from
+           format_og_payload() with a ParentGroupId key naming the parent
+           group ID, OGs without one are created under parentog_id.
+           OGs whose group ID exists are skipped. Returns a dict of
+           Ids (group ID => OG ID), Created, Existing and Failed group
+           IDs. Invalid payloads, blank and duplicate group IDs are
+           not created and are listed in Failed as given"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        og_index = self.get_og_index()
+        if og_index is None:
+            self.error("Unable to load the OG index")
+            return False
+
+        report = {}
+        report['Ids'] = {}
+        report['Created'] = []
+        report['Existing'] = []
+        report['Failed'] = []
+
+        nodes = {}
+        duplicates = []
+        for payload in og_tree:
+            if not isinstance(payload, dict) or not payload.get("GroupId"):
+                self.error("Invalid OG payload: %s", payload)
+                report['Failed'].append(payload)
+            elif payload["GroupId"] in nodes:
+                duplicates.append(payload["GroupId"])
+            else:
+                nodes[payload["GroupId"]] = payload
+
+        # It's not clear which payload is wanted, create neither
+        for group_id in dict.fromkeys(duplicates):
+            self.error("Duplicate OG group ID %s", group_id)
+            report['Failed'] += [group_id] * (duplicates.count(group_id) + 1)
+            del nodes[group_id]
+
+        # Work out the depth of each OG in the tree
+        depths = {}
+
+        def depth(group_id, seen=()):
+            if group_id not in depths:
+                parent = nodes[group_id].get("ParentGroupId")
+                if parent is None or parent not in nodes:
+                    depths[group_id] = 0
+                elif parent in seen:
+                    self.error("OG %s is in a parent loop", group_id)
+                    depths[group_id] = None
+                else:
+                    parent_depth = depth(parent, seen + (group_id, ))
+                    depths[group_id] = None if parent_depth is None \
+                        else parent_depth + 1
+
+            return depths[group_id]
+
+        levels = {}
+        for group_id in nodes:
+            if depth(group_id) is None:
+                report['Failed'].append(group_id)
+            else:
+                levels.setdefault(depths[group_id], []).append(group_id)
+
+        def create(group_id):
+            payload = dict(nodes[group_id])
+            parent = payload.pop("ParentGroupId", None)
+
+            existing = og_index.get("GroupId", group_id)
+            if existing is not None:
+                self.info("OG %s already exists", group_id)
+                return group_id, existing["Id"], False
+
+            if parent is None:
+                parent_id = parentog_id
+            elif parent in report['Ids']:
+                parent_id = report['Ids'][parent]
+            elif og_index.get("GroupId", parent) is not None:
+                parent_id = og_index.get("GroupId", parent)["Id"]
+            else:
+                self.error("Parent %s of OG %s doesn\'t exist", parent,
+                           group_id)
+                return group_id, None, False
+
+            created = self.create_og(parent_id,
+                                     payload,
+                                     strict_name=strict_name,
+                                     strict_group_id=False)
+            if not created:
+                return group_id, None, False
+
+            return group_id, created["Id"], True
+
+        for level in sorted(levels):
+            self.debug("Creating %i OGs at depth %i", len(levels[level]),
+                       level)
+
+            for group_id, og_id, created in self.imap_concurrent(
+                    create, levels[level]):
+                if og_id is None:
+                    report['Failed'].append(group_id)
+                elif created:
+                    report['Ids'][group_id] = og_id
+                    report['Created'].append(group_id)
+                else:
+                    report['Ids'][group_id] = og_id
+                    report['Existing'].append(group_id)
+
+        self.info("Provisioned OGs, %i created, %i existing, %i failed",
+                  len(report['Created']), len(report['Existing']),
+                  len(report['Failed']))
+
+        return report
+
     def delete_og(self, og_uuid):
         """Delete an OG using the UUID"""
-        self.info("Deleting OG %s" % og_uuid)
+        self.info("Deleting OG %s", og_uuid)
 
         response = self.rest_v2.delete("/api/system/groups/%s" % og_uuid)
 
-        return self.check_http_response(response)
+        if self.check_http_response(response):
+            if self.og_index is not None:
+                self.og_index.remove("Uuid", og_uuid)
+            return True
+
+        return False
+
+    def reprocess_product(self,
+                          product_id,
+                          device_list,
+                          force=True,
+                          report=False):
+        """Reprocess a product, all devices if device_list is empty.
+           Device lists are sent in concurrent chunks. Returns True if
+           every chunk was sent or the per device report if report is
+           True, the report for all devices has no items"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        def post(path, chunk, querystring=None):
+            response = self.rest_v1.post(path,
+                                         json=self.reprocess_payload(
+                                             product_id, chunk, force),
+                                         querystring=querystring)
+
+            # The API doesn't report faults per device
+            if self.check_http_response(response):
+                return {}
+
+            return None
+
+        path = '/api/mdm/products/reprocessProduct'
+
+        # The console has no bulk limit for reprocessing, use the default
+        reprocess_report = self.run_bulk(path,
+                                         device_list or [],
+                                         self.bulk_chunk_size,
+                                         post=post)
 
-    def reprocess_product(self, product_id, device_list, force=True):
-        """Reprocess a product"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        # All devices is one request with no device IDs
+        if not device_list and post(path, []) is None:
+            reprocess_report['FailedChunks'] += 1
 
+        if report:
+            return reprocess_report
+
+        return reprocess_report['FailedChunks'] == 0
+
+    @staticmethod
+    def reprocess_payload(product_id, device_list, force=True):
+        """Formats a reprocessProduct payload, no device IDs reprocesses
+           all devices"""
         payload = {}
         payload['ForceFlag'] = force
 
         device_ids = []
-        if device_list:
-            for device in device_list:
-                device_payload = {}
-                device_payload['ID'] = device
-                device_ids.append(device_payload)
+        for device in device_list:
+            device_payload = {}
+            device_payload['ID'] = device
+            device_ids.append(device_payload)
 
         payload['DeviceIds'] = device_ids
         payload['ProductID'] = product_id
 
-        response = self.rest_v1.post('/api/mdm/products/reprocessProduct',
-                                     json=payload)
+        return payload
 
-        return self.check_http_response(response)
+    def reprocess_products(self, products, force=True, report=False):
+        """Reprocess many products concurrently, products is a dict of
+           product ID => device list or a list of product IDs to reprocess
+           all devices. Returns a dict of product ID => reprocess_product()
+           result"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        if not isinstance(products, dict):
+            products = dict.fromkeys(products)
+
+        def reprocess(product_id):
+            return product_id, self.reprocess_product(product_id,
+                                                      products[product_id],
+                                                      force, report)
+
+        results = {}
+        for product_id, result in self.imap_concurrent(reprocess, products):
+            results[product_id] = result
+
+        return results
 
     def create_product(self,
                        name,
@@ -1267,7 +2618,7 @@ class WSO():
                        managed_by_og=None):
         """Creates a product using fileId, actionType.
          Product will be inactive and has no assigned groups. Returns int of new ID"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         action = {}
 
@@ -1303,23 +2654,25 @@ class WSO():
         payload['Manifest']['Action'] = []
         payload['Manifest']['Action'].append(action)
 
-        self.debug("Create product: %s" % payload)
+        self.debug("Create product: %s", payload)
 
         product_name = self.find_product(name)
 
         if not product_name:
-            self.debug("Product %s does not exist" % name)
+            self.debug("Product %s does not exist", name)
 
             response = self.rest_v1.post('/api/mdm/products/create',
                                          json=payload)
 
             if self.check_http_response(response):
-                return self.str_to_json(response.text)['Value']
+                product_id = self.str_to_json(response.text)['Value']
+                self.invalidate_name("products", product_id, name)
+                return product_id
             else:
-                self.error("Unable to create product %s" % product_name)
+                self.error("Unable to create product %s", product_name)
 
         else:
-            self.error("Product %s already exists, unable to create" %
+            self.error("Product %s already exists, unable to create",
                        product_name)
             return False
 
@@ -1334,16 +2687,42 @@ class WSO():
                  pagesize=500,
                  page=0):
         """Search for a user"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
+
+        # Set base URL
+        url = '/api/system/users/search'
+
+        querystring = self.user_querystring(firstname=firstname,
+                                            lastname=lastname,
+                                            email=email,
+                                            locationgroupId=locationgroupId,
+                                            role=role,
+                                            username=username,
+                                            status=status)
+        if querystring is False:
+            return False
+
+        querystring['pagesize'] = pagesize
+        querystring['page'] = page
+
+        return self.simple_get(url, querystring, 1)
+
+    def user_querystring(self,
+                         firstname=None,
+                         lastname=None,
+                         email=None,
+                         locationgroupId=None,
+                         role=None,
+                         username=None,
+                         status=None):
+        """Creates the querystring for a user search"""
+        self.info("args: %s", LazyArgs(locals()))
 
         if status:
             if status not in ("Active", "Inactive"):
                 self.error("Invalid user status parameter")
                 return False
 
-        # Set base URL
-        url = '/api/system/users/search'
-
         # Map ids against the WSO format
         ids = {}
         ids["firstname"] = firstname
@@ -1365,13 +2744,22 @@ class WSO():
             self.error("No User search parameters speficied")
             return False
 
-        self.info("Searching by %s for %s" % (_id, ids[_id]))
-        querystring = self.querystring(searchBy=_id,
-                                       id=ids[_id],
-                                       pagesize=pagesize,
-                                       page=page)
+        self.info("Searching by %s for %s", _id, ids[_id])
+        return self.querystring(searchBy=_id, id=ids[_id])
 
-        return self.simple_get(url, querystring, 1)
+    def iter_users(self, pagesize=500, stream=False, **search):
+        """Generator of users, yields one user at a time.
+           Accepts the same search parameters as get_user(),
+           stream decodes each page as it is downloaded"""
+        if stream:
+            querystring = self.user_querystring(**search)
+            if querystring is False:
+                return iter([])
+
+            return self.stream_pages('/api/system/users/search', "Users",
+                                     querystring, 1, pagesize)
+
+        return self.iter_pages(self.get_user, "Users", pagesize, **search)
 
     def change_user(self, device_id=int, user_id=int):
         """Change the enrolment user for a device"""
@@ -1383,13 +2771,13 @@ class WSO():
     def delete_device(self, device_id):
         """Delete a device using the device ID"""
         response = self.rest_v1.delete('/api/mdm/devices/%s' % device_id)
-        self.warning("%s has been deleted" % device_id)
+        self.warning("%s has been deleted", device_id)
 
         return self.check_http_response(response, 200)
 
     def action(self, action: str, _id, id_type):
         """Performs an action on a device"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         actions = []
         actions.append('Lock')
@@ -1401,13 +2789,13 @@ class WSO():
         actions.append('EnterpriseReset')
 
         if action not in actions:
-            self.error("Invalid action: %s" % action)
+            self.error("Invalid action: %s", action)
             return False
 
-        self.info("Performing %s on %s" % (action, _id))
+        self.info("Performing %s on %s", action, _id)
         querystring = self.querystring(searchBy=id_type,
                                        id=_id,
-                                       command="EnterpriseWipe")
+                                       command=action)
 
         response = self.rest_v1.post('/api/mdm/devices/commands',
                                      querystring=querystring)
@@ -1420,7 +2808,7 @@ class WSO():
                         serial_number=None,
                         imei=None):
         """Enterprise wipe a device"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Map ids against the WSO format
         ids = {}
@@ -1444,7 +2832,166 @@ class WSO():
 
         return self.check_http_response(response, 202)
 
-    # TODO Add Bulk commands
+    def chunk_list(self, items, size):
+        """Splits a list into lists of at most size items"""
+        items = list(items)
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def post_bulk(self, path, values, querystring=None):
+        """POSTs a BulkValues payload, returns a dict of value => fault
+           message for the values that failed or None if the request failed"""
+        self.info("Posting %i bulk values to %s", len(values), path)
+
+        response = self.rest_v1.post(path,
+                                     json=self.bulk_payload(values),
+                                     querystring=querystring)
+
+        return self.bulk_faults(path, response)
+
+    @staticmethod
+    def bulk_payload(values):
+        """Formats values as a BulkValues payload"""
+        payload = {}
+        payload['BulkValues'] = {}
+        payload['BulkValues']['Value'] = values
+
+        return payload
+
+    def bulk_faults(self, path, response):
+        """Reads the faults from a bulk response, returns a dict of
+           value => fault message or None if the request failed"""
+        if not self.check_http_response(response):
+            self.error("Bulk request to %s failed: %s", path,
+                       response.status_code)
+            return None
+
+        faults = {}
+        body = self.str_to_json(response.text) if response.text else None
+        if body:
+            for fault in (body.get('Faults') or {}).get('Fault') or []:
+                faults[str(fault.get('ItemValue'))] = fault.get('Message')
+
+        return faults
+
+    def run_bulk(self,
+                 path,
+                 values,
+                 chunk_size,
+                 querystring=None,
+                 retries=2,
+                 post=None):
+        """Sends values to a bulk endpoint in concurrent chunks, chunks
+           that fail are retried. post sends a chunk and defaults to
+           post_bulk(). Returns a per value report, FailedChunks counts
+           the chunks that couldn't be sent"""
+        if post is None:
+            post = self.post_bulk
+
+        chunks = self.bulk_chunks(path, values, chunk_size)
+
+        def send(chunk):
+            faults = post(path, chunk, querystring)
+
+            for attempt in range(retries):
+                if faults is not None:
+                    break
+                self.warning("Retrying chunk of %i, attempt %i", len(chunk),
+                             attempt + 1)
+                time.sleep(2**attempt)
+                faults = post(path, chunk, querystring)
+
+            return faults
+
+        return self.bulk_report(chunks, self.imap_concurrent(send, chunks))
+
+    def bulk_chunks(self, path, values, chunk_size):
+        """Removes duplicate values and splits them into chunks"""
+        values = list(dict.fromkeys(values))
+        chunks = self.chunk_list(values, chunk_size)
+        self.debug("Sending %i values to %s in %i chunks", len(values), path,
+                   len(chunks))
+
+        return chunks
+
+    @staticmethod
+    def bulk_report(chunks, results):
+        """Builds the run_bulk() report from the chunks and the faults
+           returned for each, None for a chunk that failed"""
+        report = {}
+        report['TotalItems'] = sum(len(chunk) for chunk in chunks)
+        report['AcceptedItems'] = 0
+        report['FailedItems'] = 0
+        report['FailedChunks'] = 0
+        report['Results'] = {}
+        report['Faults'] = {}
+
+        for chunk, faults in zip(chunks, results):
+            if faults is None:
+                report['FailedChunks'] += 1
+
+            for value in chunk:
+                if faults is None:
+                    message = "Bulk request failed"
+                else:
+                    message = faults.get(str(value))
+
+                report['Results'][value] = message is None
+                if message is None:
+                    report['AcceptedItems'] += 1
+                else:
+                    report['FailedItems'] += 1
+                    report['Faults'][value] = message
+
+        return report
+
+    def bulk_command(self, command: str, devices: list, id_type="DeviceId"):
+        """Performs a command on many devices using the bulk command API,
+           returns a per device report"""
+        self.info("args: %s", LazyArgs(locals()))
+
+        # Commands supported in bulk and their bulk_limits() key, the
+        # keys are DeleteDevice, EnterpriseWipe, GPS, LockDevice and
+        # SendMessage so device wipes share the enterprise wipe limit
+        commands = {}
+        commands['Lock'] = 'LockDevice'
+        commands['EnterpriseWipe'] = 'EnterpriseWipe'
+        commands['DeviceWipe'] = 'EnterpriseWipe'
+        commands['DeviceQuery'] = None
+        commands['ClearPasscode'] = None
+        commands['SyncDevice'] = None
+        commands['EnterpriseReset'] = 'EnterpriseWipe'
+
+        # Commands where the bulk limit is a safety limit on the total
+        destructive = ['EnterpriseWipe', 'DeviceWipe', 'EnterpriseReset']
+
+        if command not in commands:
+            self.error("Invalid bulk command: %s", command)
+            return False
+
+        if id_type not in ('DeviceId', 'Macaddress', 'Udid', 'Serialnumber',
+                           'ImeiNumber'):
+            self.error("Invalid bulk id type: %s", id_type)
+            return False
+
+        limit = self.get_bulk_limit(commands[command])
+
+        # Without a safety limit there's nothing to check against
+        if command in destructive and limit is None:
+            self.error("Unable to get the %s bulk limit, refusing %s",
+                       commands[command], command)
+            return False
+
+        if command in destructive and len(set(devices)) > limit:
+            self.error("%i devices exceeds the %s bulk limit of %i",
+                       len(set(devices)), command, limit)
+            return False
+
+        querystring = self.querystring(command=command, searchby=id_type)
+
+        return self.run_bulk('/api/mdm/devices/commands/bulk',
+                             devices,
+                             limit or self.bulk_chunk_size,
+                             querystring)
 
     def find_admin(self,
                    firstname=None,
@@ -1458,7 +3005,7 @@ class WSO():
                    pagesize=500
                    ):
         """Search for admins"""
-        self.info("args: %s" % self.filter_locals(locals()))
+        self.info("args: %s", LazyArgs(locals()))
 
         # Set base URL
         url = '/api/system/admins/search'
@@ -1474,3 +3021,8 @@ class WSO():
                             page=page)
 
         return self.simple_get(url, querystring, 1)
+
+    def iter_admins(self, pagesize=500, **search):
+        """Generator of admins, yields one admin at a time.
+           Accepts the same search parameters as find_admin()"""
+        return self.iter_pages(self.find_admin, "Admins", pagesize, **search)